@@ -5,6 +5,8 @@ from .bess import api as ns3
 from .pv import api as ns4
 from .config import api as ns5
 from .v2g import api as ns6
+from .status import api as ns7
+from .telemetry import api as ns8
 
 api = Api(
     title='DERs Second Layer API',
@@ -18,3 +20,5 @@ api.add_namespace(ns3, path='/bess')
 api.add_namespace(ns4, path='/pv')
 api.add_namespace(ns5, path='/timeconfig')
 api.add_namespace(ns6, path='/v2g')
+api.add_namespace(ns7, path='/status')
+api.add_namespace(ns8, path='/telemetry')
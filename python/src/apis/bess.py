@@ -1,7 +1,9 @@
 from flask_restx import Namespace, Resource, fields
-from data.check import initialize_tables, get_db_connection
+from data.check import get_db_connection
+from .filters import device_list_parser, list_page, registry_row, invalidates_registry, NEXT_CURSOR_HEADER, LIST_MIMETYPES
+from .bulk import BulkSpec, bulk_model, read_operations, run_bulk
 
-api = Namespace('bess', description='Operations related to Battery Energy Storage Systems')
+api = Namespace('bess', description='Operations related to Battery Energy Storage Systems', decorators=[invalidates_registry])
 
 bess_model = api.model('BESS', {
     'id': fields.String(required=True, description='Unique identifier for the BESS'),
@@ -21,26 +23,27 @@ update_model = api.model('UPDATE_BESS', {
     'Emax': fields.Float(required=False, description='Maximum energy capacity of the BESS', min=0)
 })
 
+# Operações em lote (mesmas validações dos endpoints individuais)
+bulk_spec = BulkSpec('BESS', bess_model, update_model, None)
+bulk_request = bulk_model(api, 'BESS', bess_model, update_model)
+
+# Filtros da listagem (setup_id, id)
+list_parser = device_list_parser()
+
 @api.route('/')
 class BESSList(Resource):
-    @api.marshal_list_with(bess_model)
+    @api.expect(list_parser)
+    @api.produces(LIST_MIMETYPES)
+    @api.response(200, 'Success', [bess_model], headers={NEXT_CURSOR_HEADER: 'Cursor of the next page'})
     def get(self):
         """List all BESS entries"""
-        initialize_tables()
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM BESS")
-        results = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return results
+        return list_page('BESS', list_parser.parse_args(), bess_model)
 
     @api.expect(bess_model)
     @api.marshal_with(bess_model, code=201)
     def post(self):
         """Create a new BESS entry"""
         data = api.payload
-        initialize_tables()
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute("INSERT INTO BESS (id, name, setup_id, eff, Pmax, Emax) VALUES (%s, %s, %s, %s, %s, %s)",
@@ -50,19 +53,22 @@ class BESSList(Resource):
         conn.close()
         return data, 201
 
+@api.route('/bulk')
+class BESSBulk(Resource):
+    @api.expect(bulk_request)
+    @api.response(200, 'Batch applied')
+    @api.response(400, 'Batch rejected, nothing was written')
+    def post(self):
+        """Create, update and delete BESS entries in a single transaction"""
+        return run_bulk(read_operations(api.payload, lambda op, entry: (bulk_spec, entry)))
+
 @api.route('/<string:id>')
 @api.param('id', 'The BESS identifier')
 class BESSResource(Resource):
     @api.marshal_with(bess_model)
     def get(self, id):
         """Fetch a single BESS entry by ID"""
-        initialize_tables()
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM BESS WHERE id = %s", (id,))
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        result = registry_row('BESS', id)
         if result:
             return result
         api.abort(404, "BESS not found")
@@ -77,7 +83,6 @@ class BESSResource(Resource):
         if not data:
             api.abort(400, "No input data provided")
             
-        initialize_tables()
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -135,7 +140,6 @@ class BESSResource(Resource):
 
     def delete(self, id):
         """Delete a BESS entry"""
-        initialize_tables()
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute("DELETE FROM BESS WHERE id = %s", (id,))
@@ -0,0 +1,192 @@
+from collections import namedtuple
+from flask_restx import fields, abort
+from jsonschema import Draft4Validator
+from data.check import get_db_connection
+import mysql.connector
+import os
+
+# Itens aceitos por requisição de operações em lote
+BULK_MAX_ITEMS = int(os.getenv('API_BULK_MAX_ITEMS', 10000))
+
+# Tabela de dispositivos que aceita operações em lote: modelos de criação/atualização
+# e validação extra (ex.: validate_nconn), que devolve uma lista de erros
+BulkSpec = namedtuple('BulkSpec', ['table', 'model', 'update_model', 'validate'])
+
+OPS = ('create', 'update', 'delete')
+
+
+def bulk_model(api, name, model, update_model):
+    """Swagger model of a bulk request: {"create": [...], "update": [...], "delete": [ids]}"""
+    update = api.clone(f'{name}_BULK_UPDATE', update_model, {
+        'id': fields.String(required=True, description='Identifier of the device to update'),
+    })
+    return api.model(f'{name}_BULK', {
+        'create': fields.List(fields.Nested(model), description='Devices to create'),
+        'update': fields.List(fields.Nested(update), description='Changes, identified by id'),
+        'delete': fields.List(fields.String, description='Identifiers of the devices to delete'),
+    })
+
+
+def read_operations(payload, spec_of):
+    """
+    Flatten a bulk payload into [(spec, op, item)]; `spec_of(op, entry)`
+    returns the spec and the device item of each entry.
+    """
+    if not isinstance(payload, dict) or not set(payload) <= set(OPS):
+        abort(400, "Payload must be an object with 'create', 'update' and/or 'delete' lists")
+    operations = []
+    for op in OPS:
+        entries = payload.get(op) or []
+        if not isinstance(entries, list):
+            abort(400, f"'{op}' must be a list")
+        operations += [(op, entry) for entry in entries]
+    if not operations:
+        abort(400, "No operations given")
+    if len(operations) > BULK_MAX_ITEMS:
+        abort(400, f"At most {BULK_MAX_ITEMS} operations per request")
+    return [spec_of(op, entry) + (op,) for op, entry in operations]
+
+
+def _schema_errors(model, item):
+    validator = Draft4Validator(model.__schema__)
+    return [f"{'.'.join(str(part) for part in error.path) or 'item'}: {error.message}"
+            for error in validator.iter_errors(item)]
+
+
+def validate_item(spec, op, item):
+    """Validation errors of one operation (same rules as the single-item endpoints)."""
+    if op == 'delete':
+        return [] if isinstance(item, str) and item else ["id must be a non-empty string"]
+    if not isinstance(item, dict):
+        return ["item must be an object"]
+    # null equivale a campo ausente
+    item = {key: value for key, value in item.items() if value is not None}
+    if op == 'create':
+        errors = _schema_errors(spec.model, item)
+        errors += [f"Unknown field: {key}" for key in item if key not in spec.model]
+    else:
+        changes = {key: value for key, value in item.items() if key != 'id'}
+        errors = [] if isinstance(item.get('id'), str) else ["id must be a string"]
+        errors += _schema_errors(spec.update_model, changes)
+        errors += [f"Unknown field: {key}" for key in changes if key not in spec.update_model]
+        if not changes:
+            errors.append("No fields to update")
+    if spec.validate:
+        errors += spec.validate(item)
+    return errors
+
+
+def _device_id(op, item):
+    return item if op == 'delete' else item.get('id')
+
+
+def _check_rows(cursor, operations, results, setup_id):
+    """Existence of the devices and setups referenced by the batch, in the open transaction."""
+    ids = {}
+    setups = set()
+    for spec, item, op in operations:
+        ids.setdefault(spec.table, set()).add(_device_id(op, item))
+        if op != 'delete' and item.get('setup_id') is not None:
+            setups.add(item['setup_id'])
+    existing = {}
+    for table, table_ids in ids.items():
+        table_ids = list(table_ids)
+        cursor.execute(f"SELECT id, setup_id FROM {table} WHERE id IN ({', '.join(['%s'] * len(table_ids))})",
+                       table_ids)
+        existing[table] = dict(cursor.fetchall())
+    found_setups = set()
+    if setups:
+        setups = list(setups)
+        cursor.execute(f"SELECT id FROM setup WHERE id IN ({', '.join(['%s'] * len(setups))})", setups)
+        found_setups = {row[0] for row in cursor.fetchall()}
+
+    for index, (spec, item, op) in enumerate(operations):
+        device_id = _device_id(op, item)
+        current = existing[spec.table].get(device_id, 'missing')
+        if op == 'create' and current != 'missing':
+            results[index].update(status='conflict', error=f"{spec.table} with id {device_id} already exists")
+        elif op != 'create' and (current == 'missing' or (setup_id is not None and current != setup_id)):
+            results[index].update(status='not_found', error=f"No {spec.table} found with id {device_id}")
+        elif op != 'delete' and item.get('setup_id') is not None and item['setup_id'] not in found_setups:
+            results[index].update(status='invalid', error=f"Setup with id {item['setup_id']} not found")
+
+
+def _write(cursor, operations):
+    # Um executemany por tabela e operação (as atualizações agrupadas pelo conjunto de campos)
+    groups = {}
+    for spec, item, op in operations:
+        if op == 'create':
+            columns = tuple(spec.model.keys())
+            groups.setdefault((spec.table, op, columns), []).append(tuple(item.get(key) for key in columns))
+        elif op == 'update':
+            columns = tuple(sorted(key for key, value in item.items() if key != 'id' and value is not None))
+            groups.setdefault((spec.table, op, columns), []).append(
+                tuple(item[key] for key in columns) + (item['id'],))
+        else:
+            groups.setdefault((spec.table, op, ()), []).append((item,))
+    for (table, op, columns), rows in groups.items():
+        if op == 'create':
+            cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) "
+                               f"VALUES ({', '.join(['%s'] * len(columns))})", rows)
+        elif op == 'update':
+            cursor.executemany(f"UPDATE {table} SET {', '.join(f'{key} = %s' for key in columns)} "
+                               f"WHERE id = %s", rows)
+        else:
+            cursor.executemany(f"DELETE FROM {table} WHERE id = %s", rows)
+
+
+def run_bulk(operations, setup_id=None):
+    """
+    Validate a whole batch of [(spec, item, op)] and apply it in a single
+    transaction; with `setup_id`, updates and deletes only reach devices of
+    that setup.
+
+    Returns ({'committed', 'results'}, status code). Nothing is written unless
+    every operation is valid: the results then tell which items failed
+    ('invalid', 'conflict', 'not_found') and which were only 'skipped'.
+    """
+    results = [{'index': index, 'op': op, 'id': _device_id(op, item) if isinstance(item, (dict, str)) else None}
+               for index, (spec, item, op) in enumerate(operations)]
+    seen = set()
+    for index, (spec, item, op) in enumerate(operations):
+        errors = validate_item(spec, op, item)
+        key = (spec.table, _device_id(op, item) if not errors else None)
+        if not errors and key in seen:
+            errors = [f"{spec.table} {key[1]} appears more than once in the batch"]
+        seen.add(key)
+        if errors:
+            results[index].update(status='invalid', error='; '.join(errors))
+    if any('status' in result for result in results):
+        return _rejected(results), 400
+
+    conn = get_db_connection()
+    if conn is None:
+        abort(500, "Failed to connect to the database")
+    cursor = conn.cursor()
+    try:
+        _check_rows(cursor, operations, results, setup_id)
+        if any('status' in result for result in results):
+            conn.rollback()
+            return _rejected(results), 409 if all(result.get('status') in (None, 'conflict')
+                                                   for result in results) else 400
+        _write(cursor, operations)
+        conn.commit()
+    except mysql.connector.IntegrityError as err:
+        # Escrita concorrente entre a verificação e a gravação (id duplicado, setup removido)
+        conn.rollback()
+        abort(409, f"Batch conflicts with a concurrent change: {err}")
+    except mysql.connector.Error as err:
+        conn.rollback()
+        abort(400, f"Failed to apply the batch: {err}")
+    finally:
+        cursor.close()
+        conn.close()
+    for result in results:
+        result['status'] = {'create': 'created', 'update': 'updated', 'delete': 'deleted'}[result['op']]
+    return {'committed': True, 'results': results}, 200
+
+
+def _rejected(results):
+    for result in results:
+        result.setdefault('status', 'skipped')
+    return {'committed': False, 'results': results}
@@ -1,9 +1,9 @@
 from flask_restx import Namespace, Resource, fields
-from data.check import initialize_tables, get_db_connection
 from data import check
+from .filters import registry_row, invalidates_registry
 
 # Namespace for TimeConfig
-api = Namespace('timeconfig', description='Operations related to Time Configurations')
+api = Namespace('timeconfig', description='Operations related to Time Configurations', decorators=[invalidates_registry])
 
 # Data model for TimeConfig
 time_config_model = api.model('TimeConfig', {
@@ -53,15 +53,7 @@ class TimeConfigResource(Resource):
     @api.marshal_with(time_config_model)
     def get(self):
         """Fetch the single TimeConfig entry by fixed ID"""
-        initialize_tables()
-        conn = get_db_connection()
-        if conn is None:
-            api.abort(500, "Failed to connect to the database")
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM TimeConfig WHERE id = 1")
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        result = registry_row('TimeConfig', 1)
         if not result:
             api.abort(404, "TimeConfig not found")
         return result
@@ -87,7 +79,6 @@ class TimeConfigResource(Resource):
         update_values.append(id)  # Adds the id at the end of the values list for the WHERE clause
 
         # Connect to the database and execute the update operation
-        check.initialize_tables()
         db_connection = check.get_db_connection()
         cursor = db_connection.cursor(dictionary=True)
         try:
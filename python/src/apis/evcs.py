@@ -1,8 +1,11 @@
-from flask_restx import Namespace, Resource, fields, reqparse
-from data.check import initialize_tables, get_db_connection
+from flask_restx import Namespace, Resource, fields
+from data.check import get_db_connection
+from .filters import device_list_parser, list_page, registry_row, invalidates_registry, NEXT_CURSOR_HEADER, LIST_MIMETYPES
+from .bulk import BulkSpec, bulk_model, read_operations, run_bulk
+from .v2g import validate_nconn
 
 # Criação do namespace
-api = Namespace('evcs', description='Operations related to EV Charging Stations')
+api = Namespace('evcs', description='Operations related to EV Charging Stations', decorators=[invalidates_registry])
 
 # Modelo de dados para EVCS
 evcs_model = api.model('EVCS', {
@@ -46,33 +49,28 @@ update_model = api.model('UPDATE_EVCS', {
     'conn3_Imax': fields.Float(description='Maximum current for the third connector'),
 })
 
-# Parser para o parâmetro setup_id
-parser = reqparse.RequestParser()
-parser.add_argument('setup_id', type=int, required=True, help='Setup ID to filter EVCS')
+# Operações em lote (mesmas validações dos endpoints individuais)
+bulk_spec = BulkSpec('EVCS', evcs_model, update_model, validate_nconn)
+bulk_request = bulk_model(api, 'EVCS', evcs_model, update_model)
+
+# Filtros da listagem (setup_id, id)
+list_parser = device_list_parser()
 
 # Endpoint para listar e criar EVCS
 @api.route('/')
 class EVCSList(Resource):
-    @api.marshal_list_with(evcs_model)
+    @api.expect(list_parser)
+    @api.produces(LIST_MIMETYPES)
+    @api.response(200, 'Success', [evcs_model], headers={NEXT_CURSOR_HEADER: 'Cursor of the next page'})
     def get(self):
         """List all EVCS entries"""
-        initialize_tables()
-        conn = get_db_connection()
-        if conn is None:
-            api.abort(500, "Failed to connect to the database")
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM EVCS")
-        evcs_entries = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return evcs_entries
+        return list_page('EVCS', list_parser.parse_args(), evcs_model)
 
     @api.expect(evcs_model)
     @api.marshal_with(evcs_model, code=201)
     def post(self):
         """Add a new EVCS entry"""
         data = api.payload
-        initialize_tables()
         conn = get_db_connection()
         if conn is None:
             api.abort(500, "Failed to connect to the database")
@@ -94,6 +92,16 @@ class EVCSList(Resource):
         conn.close()
         return data, 201
 
+# Endpoint para operações em lote
+@api.route('/bulk')
+class EVCSBulk(Resource):
+    @api.expect(bulk_request)
+    @api.response(200, 'Batch applied')
+    @api.response(400, 'Batch rejected, nothing was written')
+    def post(self):
+        """Create, update and delete EVCS entries in a single transaction"""
+        return run_bulk(read_operations(api.payload, lambda op, entry: (bulk_spec, entry)))
+
 # Endpoint para operações específicas do EVCS identificado por ID
 @api.route('/<string:id>')
 @api.param('id', 'The EVCS identifier')
@@ -102,15 +110,7 @@ class EVCSResource(Resource):
     @api.marshal_with(evcs_model)
     def get(self, id):
         """Fetch a single EVCS entry by id"""
-        initialize_tables()
-        conn = get_db_connection()
-        if conn is None:
-            api.abort(500, "Failed to connect to the database")
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM EVCS WHERE id = %s", (id,))
-        evcs_entry = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        evcs_entry = registry_row('EVCS', id)
         if not evcs_entry:
             api.abort(404, f"EVCS with id {id} not found")
         return evcs_entry
@@ -123,7 +123,6 @@ class EVCSResource(Resource):
         if not data:
             api.abort(400, "No input data provided")
             
-        initialize_tables()
         conn = get_db_connection()
         if conn is None:
             api.abort(500, "Failed to connect to the database")
@@ -187,7 +186,6 @@ class EVCSResource(Resource):
 
     def delete(self, id):
         """Delete an EVCS entry"""
-        initialize_tables()
         conn = get_db_connection()
         if conn is None:
             api.abort(500, "Failed to connect to the database")
@@ -200,26 +198,3 @@ class EVCSResource(Resource):
         if affected == 0:
             api.abort(404, f"No EVCS found with id {id}")
         return {"message": "EVCS deleted successfully"}, 204
-    
-
-# # Endpoint para listar EVCS por setup_id
-# @api.route('/setup')
-# class EVCSBySetup(Resource):
-#     @api.expect(parser)
-#     @api.marshal_list_with(evcs_model)
-#     def get(self):
-#         """List all EVCS entries for a specific setup"""
-#         args = parser.parse_args()
-#         setup_id = args.get('setup_id')
-#         initialize_tables()
-#         conn = get_db_connection()
-#         if conn is None:
-#             api.abort(500, "Failed to connect to the database")
-#         cursor = conn.cursor(dictionary=True)
-#         cursor.execute("SELECT * FROM EVCS WHERE setup_id = %s", (setup_id,))
-#         evcs_entries = cursor.fetchall()
-#         cursor.close()
-#         conn.close()
-#         if not evcs_entries:
-#             api.abort(404, f"No EVCS found with setup_id {setup_id}")
-#         return evcs_entries
\ No newline at end of file
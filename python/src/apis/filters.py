@@ -0,0 +1,220 @@
+from flask_restx import reqparse, marshal, abort
+from flask_restx.mask import Mask
+from flask import Response, request
+from data.check import get_db_connection
+from data.registry_cache import cache as registry
+from functools import wraps
+import base64
+import json
+import os
+
+
+def invalidates_registry(view):
+    """
+    Namespace decorator: every successful (2xx) POST/PUT/DELETE drops the
+    registry cache of all workers. Rejected writes (aborts, 4xx/5xx
+    responses) leave it untouched.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = view(*args, **kwargs)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and 200 <= response.status_code < 300:
+            registry.invalidate()
+        return response
+    return wrapper
+
+
+def fetch_one(query, values):
+    conn = get_db_connection()
+    if conn is None:
+        abort(500, "Failed to connect to the database")
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(query, values)
+    row = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return row
+
+
+def registry_row(table, id):
+    """Row of a registry table by id, through the registry cache (None if it does not exist)."""
+    return registry.get(('row', table, id), lambda: fetch_one(f"SELECT * FROM {table} WHERE id = %s", (id,)))
+
+
+def id_list(cast):
+    """reqparse type accepting comma separated values, e.g. ?setup_id=1,2"""
+    def parse(value):
+        return [cast(item) for item in str(value).split(',') if item.strip()]
+    parse.__name__ = f'{cast.__name__}_list'
+    return parse
+
+
+def device_list_parser():
+    # Filtros aceitos pelos endpoints de listagem de dispositivos; podem ser repetidos
+    parser = reqparse.RequestParser()
+    parser.add_argument('setup_id', type=id_list(int), action='append', location='args',
+                        help='Only devices of these setups (repeat or comma separate for several)')
+    parser.add_argument('id', type=id_list(str), action='append', location='args',
+                        help='Only devices with these identifiers (repeat or comma separate for several)')
+    return page_arguments(parser)
+
+
+def where_clause(args, columns=('setup_id', 'id')):
+    """Build the WHERE clause and its parameters from the parsed filter arguments."""
+    conditions = []
+    values = []
+    for column in columns:
+        requested = args.get(column)
+        if not requested:
+            continue
+        # action='append' com id_list gera uma lista de listas
+        flat = [value for group in requested for value in group]
+        conditions.append(f"{column} IN ({', '.join(['%s'] * len(flat))})")
+        values.extend(flat)
+    if not conditions:
+        return '', ()
+    return ' WHERE ' + ' AND '.join(conditions), tuple(values)
+
+
+# Tamanho máximo (e padrão) de uma página das listagens
+LIST_LIMIT = int(os.getenv('API_LIST_LIMIT', 1000))
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+# Exportação em streaming (Accept: application/x-ndjson): linhas lidas do cursor por vez
+NDJSON = 'application/x-ndjson'
+LIST_MIMETYPES = ['application/json', NDJSON]
+STREAM_BATCH = int(os.getenv('API_STREAM_BATCH', 500))
+
+
+def page_arguments(parser):
+    # Paginação por chave (keyset) e projeção de campos, comuns a todas as listagens
+    parser.add_argument('limit', type=int, location='args',
+                        help=f'Maximum number of rows in the page (1 to {LIST_LIMIT}, default {LIST_LIMIT})')
+    parser.add_argument('cursor', type=str, location='args',
+                        help=f'Continue after the previous page (value of its {NEXT_CURSOR_HEADER} header)')
+    parser.add_argument('fields', type=id_list(str), action='append', location='args',
+                        help='Only these fields (repeat or comma separate for several)')
+    return parser
+
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        abort(400, "Invalid cursor")
+    # Só chaves primárias (texto ou inteiro) são cursores válidos
+    if not isinstance(value, (str, int)) or isinstance(value, bool):
+        abort(400, "Invalid cursor")
+    return value
+
+
+def page_query(table, args, model, columns=('setup_id', 'id'), key='id', stream=False):
+    """
+    Build the query of one list page: filters, `key` > cursor, ORDER BY key
+    and LIMIT limit + 1 (the extra row tells if there is a next page).
+
+    Returns (query, values, limit, fields); only the requested `fields` (plus
+    the key, needed for the cursor) are selected. A `stream` without an
+    explicit limit has no LIMIT at all.
+    """
+    limit = args.get('limit')
+    if limit is None and not stream:
+        limit = LIST_LIMIT
+    if limit is not None and not (1 <= limit and (stream or limit <= LIST_LIMIT)):
+        abort(400, f"limit must be between 1 and {LIST_LIMIT}")
+    output = model
+    selected = list(model.keys())
+    if args.get('fields'):
+        requested = [field for group in args['fields'] for field in group]
+        unknown = [field for field in requested if field not in model]
+        if unknown:
+            abort(400, f"Unknown fields: {', '.join(unknown)}")
+        output = Mask('{' + ','.join(requested) + '}').apply(model)
+        selected = [field for field in model.keys() if field in requested or field == key]
+    where, values = where_clause(args, columns)
+    if args.get('cursor'):
+        where += (' AND ' if where else ' WHERE ') + f"{key} > %s"
+        values = values + (decode_cursor(args['cursor']),)
+    query = f"SELECT {', '.join(selected)} FROM {table}{where} ORDER BY {key}"
+    if limit is None:
+        return query, values, limit, output
+    return query + " LIMIT %s", values + (limit + 1,), limit, output
+
+
+def wants_stream():
+    return request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+
+def stream_rows(conn, cursor, output, key, limit):
+    """
+    Generator of NDJSON lines read from an unbuffered cursor, STREAM_BATCH rows
+    at a time. With a `limit`, a last line {"next_cursor": ...} is written when
+    more rows remain.
+    """
+    try:
+        sent, last = 0, None
+        while True:
+            rows = cursor.fetchmany(STREAM_BATCH)
+            if not rows:
+                return
+            more = limit is not None and sent + len(rows) > limit
+            if more:
+                rows = rows[:limit - sent]
+            lines = [json.dumps(marshal(row, output)) for row in rows]
+            if rows:
+                sent, last = sent + len(rows), rows[-1][key]
+            if more:
+                lines.append(json.dumps({'next_cursor': encode_cursor(last)}))
+            yield ''.join(line + '\n' for line in lines)
+            if more:
+                return
+    finally:
+        # Cliente desconectou ou limite atingido: descarta o resto do resultado antes de fechar
+        if conn.unread_result:
+            conn.consume_results()
+        cursor.close()
+        conn.close()
+
+
+def fetch_all(query, values):
+    conn = get_db_connection()
+    if conn is None:
+        abort(500, "Failed to connect to the database")
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(query, values)
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return rows
+
+
+def stream_page(query, values, output, key, limit):
+    conn = get_db_connection()
+    if conn is None:
+        abort(500, "Failed to connect to the database")
+    # A consulta começa antes da resposta: erros ainda viram 500 em vez de um stream truncado
+    cursor = conn.cursor(dictionary=True, buffered=False)
+    cursor.execute(query, values)
+    return Response(stream_rows(conn, cursor, output, key, limit), mimetype=NDJSON)
+
+
+def list_page(table, args, model, columns=('setup_id', 'id'), key='id'):
+    """
+    Run a list page query and return (body, status, headers) with the next
+    cursor header, or stream every row as NDJSON when the client accepts
+    application/x-ndjson.
+    """
+    stream = wants_stream()
+    query, values, limit, output = page_query(table, args, model, columns, key, stream)
+    if stream:
+        return stream_page(query, values, output, key, limit)
+    # Páginas repetidas (ex.: o otimizador lendo o cadastro a cada ciclo) vêm do cache
+    rows = registry.get(('page', query, values), lambda: fetch_all(query, values))
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1][key])
+    return marshal(rows, output), 200, headers
@@ -1,8 +1,10 @@
 from flask_restx import Namespace, Resource, fields
-from data.check import initialize_tables, get_db_connection
+from data.check import get_db_connection
+from .filters import device_list_parser, list_page, registry_row, invalidates_registry, NEXT_CURSOR_HEADER, LIST_MIMETYPES
+from .bulk import BulkSpec, bulk_model, read_operations, run_bulk
 
 # Namespace for PV systems
-api = Namespace('pv', description='Operations related to Photovoltaic Systems')
+api = Namespace('pv', description='Operations related to Photovoltaic Systems', decorators=[invalidates_registry])
 
 # Data model for PV
 pv_model = api.model('PV', {
@@ -20,27 +22,27 @@ update_model = api.model('UPDATE_PV', {
     'Pmax': fields.Float(required=False, description='Maximum power capacity of the PV system', min=0)
 })
 
+# Operações em lote (mesmas validações dos endpoints individuais)
+bulk_spec = BulkSpec('PV', pv_model, update_model, None)
+bulk_request = bulk_model(api, 'PV', pv_model, update_model)
+
+# Filtros da listagem (setup_id, id)
+list_parser = device_list_parser()
 
 @api.route('/')
 class PVList(Resource):
-    @api.marshal_list_with(pv_model)
+    @api.expect(list_parser)
+    @api.produces(LIST_MIMETYPES)
+    @api.response(200, 'Success', [pv_model], headers={NEXT_CURSOR_HEADER: 'Cursor of the next page'})
     def get(self):
         """List all PV systems"""
-        initialize_tables()
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM PV")
-        results = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return results
+        return list_page('PV', list_parser.parse_args(), pv_model)
 
     @api.expect(pv_model)
     @api.marshal_with(pv_model, code=201)
     def post(self):
         """Create a new PV system"""
         data = api.payload
-        initialize_tables()
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute("INSERT INTO PV (id, name, setup_id, eff, Pmax) VALUES (%s, %s, %s, %s, %s)",
@@ -50,6 +52,15 @@ class PVList(Resource):
         conn.close()
         return data, 201
 
+@api.route('/bulk')
+class PVBulk(Resource):
+    @api.expect(bulk_request)
+    @api.response(200, 'Batch applied')
+    @api.response(400, 'Batch rejected, nothing was written')
+    def post(self):
+        """Create, update and delete PV systems in a single transaction"""
+        return run_bulk(read_operations(api.payload, lambda op, entry: (bulk_spec, entry)))
+
 @api.route('/<string:id>')
 @api.param('id', 'The PV system identifier')
 @api.response(404, 'PV system not found')
@@ -57,13 +68,7 @@ class PVResource(Resource):
     @api.marshal_with(pv_model)
     def get(self, id):
         """Fetch a single PV system by ID"""
-        initialize_tables()
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM PV WHERE id = %s", (id,))
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        result = registry_row('PV', id)
         if result:
             return result
         api.abort(404, "PV system not found")
@@ -76,7 +81,6 @@ class PVResource(Resource):
         if not data:
             api.abort(400, "No input data provided")
             
-        initialize_tables()
         conn = get_db_connection()
         if conn is None:
             api.abort(500, "Failed to connect to the database")
@@ -132,7 +136,6 @@ class PVResource(Resource):
 
     def delete(self, id):
         """Delete a PV system"""
-        initialize_tables()
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute("DELETE FROM PV WHERE id = %s", (id,))
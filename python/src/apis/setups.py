@@ -1,7 +1,12 @@
 from flask_restx import Resource, fields, Namespace, reqparse, abort
-from data import check
+from data import check, history, repository
+from data.registry_cache import cache as registry
+from datetime import datetime, timedelta, timezone
+from .filters import id_list, page_arguments, list_page, registry_row, invalidates_registry, NEXT_CURSOR_HEADER, LIST_MIMETYPES
+from .bulk import read_operations, run_bulk
+from . import bess, evcs, pv, v2g
 
-api = Namespace('setups', description='Setup related operations')
+api = Namespace('setups', description='Setup related operations', decorators=[invalidates_registry])
 
 setup_model = api.model('Setup', {
     'id': fields.Integer(readOnly=True, description='The setup identifier'),
@@ -24,6 +29,64 @@ device_model = api.model('Device', {
     'data': fields.Raw(description='Device data')
 })
 
+# Setup com todos os seus dispositivos agrupados por tipo
+topology_model = api.clone('SetupTopology', setup_model, {
+    'bess': fields.List(fields.Nested(bess.bess_model), description='BESS of the setup'),
+    'pv': fields.List(fields.Nested(pv.pv_model), description='PV systems of the setup'),
+    'evcs': fields.List(fields.Nested(evcs.evcs_model), description='EVCS of the setup'),
+    'v2g': fields.List(fields.Nested(v2g.v2g_model), description='V2G systems of the setup'),
+})
+
+# Operações em lote nos dispositivos de um setup: {"type": ..., "data": {...}}, ou {"type": ..., "id": ...} para remover
+BULK_SPECS = {'BESS': bess.bulk_spec, 'PV': pv.bulk_spec, 'EVCS': evcs.bulk_spec, 'V2G': v2g.bulk_spec}
+device_bulk_model = api.model('DeviceBulk', {
+    'create': fields.List(fields.Nested(device_model), description='Devices to create (setup_id is the one in the path)'),
+    'update': fields.List(fields.Nested(device_model), description='Changes, identified by data.id'),
+    'delete': fields.List(fields.Raw, description='Devices to delete, as {"type": ..., "id": ...}'),
+})
+
+# Filtro da listagem por identificador (pode ser repetido)
+id_parser = reqparse.RequestParser()
+id_parser.add_argument('id', type=id_list(int), action='append', location='args',
+                       help='Only setups with these identifiers (repeat or comma separate for several)')
+list_parser = page_arguments(id_parser.copy())
+
+# Intervalo e resolução do histórico (padrão: últimas 24 h, resolução escolhida pelo intervalo)
+history_parser = reqparse.RequestParser()
+history_parser.add_argument('start', type=str, location='args', help='Start of the range (ISO 8601, default: end - 24 h)')
+history_parser.add_argument('end', type=str, location='args', help='End of the range (ISO 8601, default: now)')
+history_parser.add_argument('resolution', type=int, location='args',
+                            help='Desired resolution in seconds (default: range / %d)' % history.HISTORY_MAX_POINTS)
+
+
+def parse_utc(value):
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def setup_with_devices(id):
+    # Setup e dispositivos numa única consulta, através do cache do cadastro
+    return registry.get(('setup_with_devices', id), lambda: repository.get_setup_with_devices(id))
+
+def device_operation(setup_id):
+    # Converte cada entrada do lote no (spec, item) da tabela do dispositivo
+    def spec_of(op, entry):
+        if not isinstance(entry, dict) or entry.get('type') not in BULK_SPECS:
+            abort(400, f"Every '{op}' entry needs a type among {', '.join(BULK_SPECS)}")
+        spec = BULK_SPECS[entry['type']]
+        if op == 'delete':
+            return spec, entry.get('id')
+        if not isinstance(entry.get('data'), dict):
+            abort(400, f"Every '{op}' entry needs a data object")
+        if op == 'create':
+            return spec, dict(entry['data'], setup_id=setup_id)
+        # Um lote deste setup não move dispositivos para outro setup
+        if entry['data'].get('setup_id', setup_id) != setup_id:
+            abort(400, f"Updates under setup {setup_id} cannot change setup_id")
+        return spec, entry['data']
+    return spec_of
+
 def validate_setup(data):
     errors = []
     if 'Pmax' in data and (data['Pmax'] <= 0):
@@ -36,17 +99,12 @@ def validate_setup(data):
 
 @api.route('/')
 class SetupList(Resource):
-    @api.marshal_list_with(setup_model)
+    @api.expect(list_parser)
+    @api.produces(LIST_MIMETYPES)
+    @api.response(200, 'Success', [setup_model], headers={NEXT_CURSOR_HEADER: 'Cursor of the next page'})
     def get(self):
         '''List all setups'''
-        check.initialize_tables()
-        db_connection = check.get_db_connection()
-        cursor = db_connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM setup")
-        setups = cursor.fetchall()
-        cursor.close()
-        db_connection.close()
-        return setups
+        return list_page('setup', list_parser.parse_args(), setup_model, columns=('id',))
 
     @api.expect(setup_model)
     @api.marshal_with(setup_model, code=201)
@@ -59,7 +117,6 @@ class SetupList(Resource):
         if errors:
             abort(400, ". ".join(errors))
         
-        check.initialize_tables()
         db_connection = check.get_db_connection()
         cursor = db_connection.cursor(dictionary=True)
         cursor.execute("INSERT INTO setup (name, Pmax, Vnom, controllable) VALUES (%s, %s, %s, %s)",
@@ -81,13 +138,7 @@ class Setup(Resource):
     @api.marshal_with(setup_model)
     def get(self, id):
         '''Fetch a setup given its identifier'''
-        check.initialize_tables()
-        db_connection = check.get_db_connection()
-        cursor = db_connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM setup WHERE id = %s", (id,))
-        setup = cursor.fetchone()
-        cursor.close()
-        db_connection.close()
+        setup = registry_row('setup', id)
         if setup:
             return setup
         abort(404)
@@ -118,7 +169,6 @@ class Setup(Resource):
         update_values.append(id)  # Adds the id at the end of the values list for the WHERE clause
 
         # Connect to the database and execute the update operation
-        check.initialize_tables()
         db_connection = check.get_db_connection()
         cursor = db_connection.cursor(dictionary=True)
         try:
@@ -152,7 +202,6 @@ class Setup(Resource):
     @api.response(204, 'Setup successfully deleted.')
     def delete(self, id):
         '''Delete a setup given its identifier, only if it exists'''
-        check.initialize_tables()
         db_connection = check.get_db_connection()
         cursor = db_connection.cursor(dictionary=True)
         
@@ -188,42 +237,82 @@ class SetupDevices(Resource):
     @api.marshal_list_with(device_model)
     def get(self, id):
         '''Fetch all devices associated with a setup given its identifier'''
-        check.initialize_tables()
-        db_connection = check.get_db_connection()
-        cursor = db_connection.cursor(dictionary=True)
-        
-        # Verify the setup exists
-        cursor.execute("SELECT id FROM setup WHERE id = %s", (id,))
-        setup = cursor.fetchone()
-        if not setup:
-            cursor.close()
-            db_connection.close()
+        # Setup e dispositivos numa única consulta
+        setup = setup_with_devices(id)
+        if setup is None:
             abort(404, f"Setup with id {id} not found.")
-        
-        # Fetch all associated devices
-        devices = []
+        devices = [{'type': device_type, 'data': entry}
+                   for device_type, key in repository.DEVICE_KEYS.items() for entry in setup[key]]
+        return devices
 
-        cursor.execute("SELECT * FROM BESS WHERE setup_id = %s", (id,))
-        bess_entries = cursor.fetchall()
-        for entry in bess_entries:
-            devices.append({'type': 'BESS', 'data': entry})
 
-        cursor.execute("SELECT * FROM PV WHERE setup_id = %s", (id,))
-        pv_entries = cursor.fetchall()
-        for entry in pv_entries:
-            devices.append({'type': 'PV', 'data': entry})
+@api.route('/topology')
+class Topology(Resource):
+    @api.expect(id_parser)
+    @api.marshal_list_with(topology_model)
+    def get(self):
+        '''Every setup (or those given by id) with its devices, from a single query'''
+        args = id_parser.parse_args()
+        setup_ids = [value for group in args['id'] for value in group] if args['id'] else None
+        return registry.get(('topology', tuple(setup_ids) if setup_ids else None),
+                            lambda: repository.load_setups_with_devices(setup_ids))
+
 
-        cursor.execute("SELECT * FROM EVCS WHERE setup_id = %s", (id,))
-        evcs_entries = cursor.fetchall()
-        for entry in evcs_entries:
-            devices.append({'type': 'EVCS', 'data': entry})
+@api.route('/<int:id>/topology')
+@api.param('id', 'The setup identifier')
+@api.response(404, 'Setup not found')
+class SetupTopology(Resource):
+    @api.marshal_with(topology_model)
+    def get(self, id):
+        '''A setup with its devices, from a single query'''
+        setup = setup_with_devices(id)
+        if setup is None:
+            abort(404, f"Setup with id {id} not found.")
+        return setup
 
-        cursor.execute("SELECT * FROM V2G WHERE setup_id = %s", (id,))
-        v2g_entries = cursor.fetchall()
-        for entry in v2g_entries:
-            devices.append({'type': 'V2G', 'data': entry})
 
+@api.route('/<int:id>/devices/bulk')
+@api.param('id', 'The setup identifier')
+@api.response(404, 'Setup not found')
+class SetupDevicesBulk(Resource):
+    @api.expect(device_bulk_model)
+    @api.response(200, 'Batch applied')
+    @api.response(400, 'Batch rejected, nothing was written')
+    def post(self, id):
+        '''Create, update and delete devices of a setup in a single transaction'''
+        operations = read_operations(api.payload, device_operation(id))
+        # Escrita: confere no banco, não no cache (o setup pode ter sido removido por outro worker)
+        db_connection = check.get_db_connection()
+        cursor = db_connection.cursor()
+        cursor.execute("SELECT id FROM setup WHERE id = %s", (id,))
+        setup = cursor.fetchone()
         cursor.close()
         db_connection.close()
-        
-        return devices
\ No newline at end of file
+        if not setup:
+            abort(404, f"Setup with id {id} not found.")
+        # Atualizações e remoções só alcançam dispositivos deste setup
+        return run_bulk(operations, setup_id=id)
+
+
+@api.route('/<int:id>/history')
+@api.param('id', 'The setup identifier')
+@api.response(404, 'Setup not found')
+class SetupHistory(Resource):
+    @api.expect(history_parser)
+    def get(self, id):
+        '''Measurement and dispatch history of a setup, from the coarsest rollup that fits the request'''
+        args = history_parser.parse_args()
+        try:
+            end = parse_utc(args['end']) if args['end'] else datetime.utcnow()
+            start = parse_utc(args['start']) if args['start'] else end - timedelta(hours=24)
+        except ValueError as e:
+            abort(400, f"Invalid date: {e}")
+        if start >= end:
+            abort(400, "start must be before end")
+        if args['resolution'] is not None and args['resolution'] <= 0:
+            abort(400, "resolution must be a positive number of seconds")
+        setup = setup_with_devices(id)
+        if setup is None:
+            abort(404, f"Setup with id {id} not found.")
+        device_ids = [device['id'] for key in ('bess', 'pv', 'evcs', 'v2g') for device in setup[key]]
+        return history.query_history(id, device_ids, start, end, args['resolution'])
@@ -0,0 +1,27 @@
+from flask_restx import Namespace, Resource
+from data.pool import pool_stats
+from data import telemetry
+from data.registry_cache import cache as registry
+
+api = Namespace('status', description='Runtime statistics of the API worker')
+
+
+@api.route('/db-pool')
+class DBPoolStatus(Resource):
+    def get(self):
+        """Connection pool statistics of the worker that served the request"""
+        return pool_stats()
+
+
+@api.route('/telemetry')
+class TelemetryStatus(Resource):
+    def get(self):
+        """Telemetry ingestion statistics of the worker that served the request"""
+        return telemetry.stats()
+
+
+@api.route('/registry-cache')
+class RegistryCacheStatus(Resource):
+    def get(self):
+        """Registry cache (setups, devices, TimeConfig) statistics of the worker that served the request"""
+        return registry.stats()
@@ -0,0 +1,88 @@
+from flask_restx import Namespace, Resource
+from flask import request
+from data.check import get_db_connection
+from data.telemetry import parse_reading, ingest, latest
+import json
+
+api = Namespace('telemetry', description='Device readings pushed by the platform or gateways')
+
+# Erros individuais devolvidos na resposta (o total de rejeitadas é sempre informado)
+MAX_ERRORS = 100
+
+
+def read_payload():
+    """Readings of the request body: NDJSON (one object per line) or a JSON array/object."""
+    body = request.get_data()
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = []
+        for line in body.splitlines():
+            if line.strip():
+                try:
+                    items.append(json.loads(line))
+                except ValueError as e:
+                    items.append(e)
+        return items
+    try:
+        payload = json.loads(body or b'null')
+    except ValueError as e:
+        api.abort(400, f"Invalid JSON: {e}")
+    if isinstance(payload, dict):
+        return [payload]
+    if not isinstance(payload, list):
+        api.abort(400, "Payload must be a reading or an array of readings")
+    return payload
+
+
+@api.route('/')
+class TelemetryIngest(Resource):
+    @api.doc(description='Readings as {"device_id", "attr", "value", "ts"}, sent as a JSON array or as NDJSON '
+                         '(Content-Type: application/x-ndjson). ts is ISO 8601 or epoch seconds (default: now).')
+    @api.response(202, 'Readings accepted for writing')
+    def post(self):
+        """Ingest a batch of device readings"""
+        rows, values, errors = [], [], []
+        rejected = 0
+        for index, item in enumerate(read_payload()):
+            try:
+                if isinstance(item, Exception):
+                    raise ValueError(f"Invalid JSON: {item}")
+                rows.append(parse_reading(item))
+                values.append(item['value'])
+            except (ValueError, TypeError) as e:
+                rejected += 1
+                if len(errors) < MAX_ERRORS:
+                    errors.append({'index': index, 'error': str(e)})
+        accepted = ingest(rows, values)
+        # Leituras que não couberam no buffer também contam como rejeitadas
+        rejected += len(rows) - accepted
+        return {'accepted': accepted, 'rejected': rejected, 'errors': errors}, 202
+
+
+@api.route('/latest/<string:device_id>')
+@api.param('device_id', 'The device identifier')
+class TelemetryLatest(Resource):
+    def get(self, device_id):
+        """Latest reading of each attribute of a device"""
+        # O banco é a referência (cada worker só vê o que ele mesmo recebeu); leituras deste
+        # worker ainda no buffer de gravação prevalecem quando são mais novas
+        conn = get_db_connection()
+        if conn is None:
+            api.abort(500, "Failed to connect to the database")
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT m.attr, m.ts, m.value, m.data FROM measurement m
+            JOIN (SELECT attr, MAX(ts) AS ts FROM measurement WHERE device_id = %s GROUP BY attr) last
+              ON last.attr = m.attr AND last.ts = m.ts
+            WHERE m.device_id = %s
+        """, (device_id, device_id))
+        results = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        readings = {row['attr']: (row['ts'], row['value'] if row['data'] is None else json.loads(row['data']))
+                    for row in results}
+        for attr, entry in latest.device(device_id).items():
+            if attr not in readings or entry.ts > readings[attr][0]:
+                readings[attr] = (entry.ts, entry.value)
+        if not readings:
+            api.abort(404, "No readings for this device")
+        return {attr: {'value': value, 'ts': ts.isoformat() + 'Z'} for attr, (ts, value) in readings.items()}
@@ -1,9 +1,11 @@
 from flask_restx import Namespace, Resource, fields
 from data.check import get_db_connection
+from .filters import device_list_parser, list_page, registry_row, invalidates_registry, NEXT_CURSOR_HEADER, LIST_MIMETYPES
+from .bulk import BulkSpec, bulk_model, read_operations, run_bulk
 import mysql.connector
 
 # Namespace creation
-api = Namespace('v2g', description='Operations related to Vehicle-to-Grid (V2G) systems')
+api = Namespace('v2g', description='Operations related to Vehicle-to-Grid (V2G) systems', decorators=[invalidates_registry])
 
 # Data model for V2G
 v2g_model = api.model('V2G', {
@@ -57,19 +59,22 @@ def validate_nconn(data):
         errors.append("Connectors 1, 2, and 3 must all be specified for nconn = 3.")
     return errors
 
+# Operações em lote (mesmas validações dos endpoints individuais)
+bulk_spec = BulkSpec('V2G', v2g_model, update_model, validate_nconn)
+bulk_request = bulk_model(api, 'V2G', v2g_model, update_model)
+
+# Filtros da listagem (setup_id, id)
+list_parser = device_list_parser()
+
 @api.route('/')
 class V2GList(Resource):
+    @api.expect(list_parser)
     @api.doc('list_v2g')
-    @api.marshal_list_with(v2g_model)
+    @api.produces(LIST_MIMETYPES)
+    @api.response(200, 'Success', [v2g_model], headers={NEXT_CURSOR_HEADER: 'Cursor of the next page'})
     def get(self):
         """List all V2G entries."""
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM V2G")
-        v2g_entries = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return v2g_entries
+        return list_page('V2G', list_parser.parse_args(), v2g_model)
 
     @api.expect(v2g_model)
     @api.doc('create_v2g')
@@ -100,6 +105,15 @@ class V2GList(Resource):
         conn.close()
         return data, 201
 
+@api.route('/bulk')
+class V2GBulk(Resource):
+    @api.expect(bulk_request)
+    @api.response(200, 'Batch applied')
+    @api.response(400, 'Batch rejected, nothing was written')
+    def post(self):
+        """Create, update and delete V2G entries in a single transaction"""
+        return run_bulk(read_operations(api.payload, lambda op, entry: (bulk_spec, entry)))
+
 @api.route('/<string:id>')
 @api.param('id', 'The V2G identifier')
 @api.response(404, 'V2G not found')
@@ -107,12 +121,7 @@ class V2GResource(Resource):
     @api.marshal_with(v2g_model)
     def get(self, id):
         """Fetch a single V2G entry by id."""
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM V2G WHERE id = %s", (id,))
-        v2g_entry = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        v2g_entry = registry_row('V2G', id)
         if not v2g_entry:
             api.abort(404, f"V2G with id {id} not found")
         return v2g_entry
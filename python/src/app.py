@@ -1,14 +1,6 @@
 from flask import Flask, Blueprint, send_from_directory
-from datetime import datetime
 from apis import api
-import opt
-import os
-
-INTERVAL = os.getenv('INTERVAL', 5)
-NOTIFY = os.getenv('NOTIFY', 1)
-
-from uwsgidecorators import *
-
+from data import migrations
 
 app = Flask(__name__)
 
@@ -17,18 +9,19 @@ blueprint = Blueprint('api', __name__, url_prefix='/ders/secondlayer')
 api.init_app(blueprint)
 app.register_blueprint(blueprint)
 
+# Migrações do esquema: uma vez na carga da aplicação e, se o banco ainda não
+# estiver disponível, novamente no primeiro request (depois disso é só uma flag)
+migrations.ensure_schema()
+
+@app.before_request
+def ensure_schema():
+    migrations.ensure_schema()
+
 @app.route('/swaggerui/<path:path>')
 def send_swagger_static(path):
     return send_from_directory('swaggerui', path)
 
-#@cron(-NOTIFY, -1, -1, -1, -1)
-#def print_ok(num):
-#    print("OK", num, datetime.now())
-
-@cron(-INTERVAL, -1, -1, -1, -1)
-def print_opt(num):
-    print('Running optimization - v4.2.1 ', num, datetime.now())
-    opt.cron_function()
+# A otimização roda no mule do uWSGI (main.py, ver app.ini); os workers HTTP não importam opt
 
 
 if __name__ == '__main__':
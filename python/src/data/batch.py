@@ -0,0 +1,155 @@
+from data.pool import get_pool
+from mysql.connector import DataError, IntegrityError, ProgrammingError
+import threading
+import atexit
+import time
+import os
+
+# Padrões: linhas acumuladas antes de gravar, tempo máximo (s) que uma linha espera no buffer
+# e limite do buffer (linhas além dele são descartadas enquanto o banco não responde)
+BATCH_SIZE = 1000
+BATCH_FLUSH_INTERVAL = 1.0
+BATCH_MAX_BUFFER = 100000
+
+# Erros causados pelas próprias linhas: repetir o lote não adianta
+DATA_ERRORS = (DataError, IntegrityError, ProgrammingError)
+
+_writers = []
+
+
+class BatchWriter:
+    """
+    Buffers rows for one INSERT statement and writes them to MySQL in bulk.
+
+    add() only appends to memory; a background thread flushes with
+    executemany, committing each batch, whenever `batch` rows are
+    waiting or the oldest row has waited `interval` seconds. Rows of a
+    flush that failed on the connection are kept for the next one, up to
+    `max_buffer`; a batch rejected for its data is retried row by row and
+    only the offending rows are dropped (counted as `rejected`).
+    """
+
+    def __init__(self, query, name, batch=BATCH_SIZE, interval=BATCH_FLUSH_INTERVAL, max_buffer=BATCH_MAX_BUFFER):
+        self.query = query
+        self.name = name
+        self.batch = batch
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self._rows = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._stats = {'received': 0, 'written': 0, 'dropped': 0, 'rejected': 0, 'flushes': 0, 'flush_errors': 0,
+                       'flush_s': 0.0}
+        _writers.append(self)
+
+    def _ensure_thread(self):
+        # Uma thread por processo (os workers uWSGI são criados por fork depois da importação)
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f'{self.name}-writer', daemon=True)
+            self._thread.start()
+
+    def add(self, rows):
+        """Queue rows for writing; returns how many fit in the buffer."""
+        with self._lock:
+            self._ensure_thread()
+            space = self.max_buffer - len(self._rows)
+            if space < len(rows):
+                self._stats['dropped'] += len(rows) - max(space, 0)
+                rows = rows[:max(space, 0)]
+            if rows and not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+            self._stats['received'] += len(rows)
+            full = len(self._rows) >= self.batch
+        if full:
+            self._wakeup.set()
+        return len(rows)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush(force=False)
+            except Exception as e:
+                print(f"Erro ao gravar {self.name}: {e}")
+
+    def flush(self, force=True):
+        """Write the buffered rows; without `force` only when a batch is full or old enough."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._rows:
+                    return 0
+                if not force and len(self._rows) < self.batch and time.monotonic() - self._oldest < self.interval:
+                    return 0
+                rows, self._rows = self._rows, []
+            start = time.perf_counter()
+            # Um commit por lote: só os lotes ainda não gravados voltam ao buffer numa falha
+            done = rejected = 0
+            try:
+                conn = get_pool().get_connection()
+                try:
+                    cursor = conn.cursor()
+                    try:
+                        for i in range(0, len(rows), self.batch):
+                            rejected += self._write(conn, cursor, rows[i:i + self.batch])
+                            conn.commit()
+                            done = min(i + self.batch, len(rows))
+                    finally:
+                        cursor.close()
+                finally:
+                    conn.close()
+            except Exception:
+                with self._lock:
+                    self._stats['flush_errors'] += 1
+                    self._stats['written'] += done - rejected
+                    self._stats['rejected'] += rejected
+                    rows = rows[done:]
+                    # Devolve ao início do buffer para a próxima tentativa, respeitando o limite
+                    keep = max(self.max_buffer - len(self._rows), 0)
+                    self._stats['dropped'] += len(rows) - min(keep, len(rows))
+                    self._rows = rows[:keep] + self._rows
+                    self._oldest = time.monotonic()
+                raise
+            with self._lock:
+                self._stats['written'] += len(rows) - rejected
+                self._stats['rejected'] += rejected
+                self._stats['flushes'] += 1
+                self._stats['flush_s'] += time.perf_counter() - start
+            return len(rows) - rejected
+
+    def _write(self, conn, cursor, rows):
+        """Write one batch; on a data error, row by row. Returns how many rows were rejected."""
+        try:
+            cursor.executemany(self.query, rows)
+            return 0
+        except DATA_ERRORS:
+            # O lote inteiro foi desfeito: grava as linhas uma a uma e descarta só as inválidas
+            conn.rollback()
+        rejected = 0
+        for row in rows:
+            try:
+                cursor.execute(self.query, row)
+            except DATA_ERRORS as e:
+                rejected += 1
+                if rejected == 1:
+                    print(f"Linha descartada ao gravar {self.name}: {e}")
+        return rejected
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, buffered=len(self._rows))
+
+
+@atexit.register
+def _flush_on_exit():
+    for writer in _writers:
+        try:
+            writer.flush()
+        except Exception as e:
+            print(f"Erro ao gravar {writer.name} pendente: {e}")
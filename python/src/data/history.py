@@ -0,0 +1,288 @@
+from datetime import datetime, date, timedelta
+from data.pool import connection_params
+from data.check import get_db_connection
+from data.batch import BatchWriter
+import mysql.connector
+import threading
+import time
+import os
+
+# Retenção (dias) das leituras brutas e de cada agregado
+HISTORY_RAW_DAYS = int(os.getenv('HISTORY_RAW_DAYS', 7))
+HISTORY_1M_DAYS = int(os.getenv('HISTORY_1M_DAYS', 30))
+HISTORY_15M_DAYS = int(os.getenv('HISTORY_15M_DAYS', 180))
+HISTORY_1H_DAYS = int(os.getenv('HISTORY_1H_DAYS', 730))
+# Período (s) da agregação em segundo plano (0 desativa) e atraso máximo (s) de leituras que ainda entram
+HISTORY_INTERVAL = float(os.getenv('HISTORY_INTERVAL', 60))
+HISTORY_LATE = float(os.getenv('HISTORY_LATE', 600))
+# Pontos por série quando a consulta não informa a resolução
+HISTORY_MAX_POINTS = int(os.getenv('HISTORY_MAX_POINTS', 500))
+# Partições diárias criadas com antecedência
+PARTITIONS_AHEAD = 3
+LOCK_NAME = 'secondlayer_history_maintenance'
+
+# Níveis disponíveis: (resolução em s, 0 = leituras brutas; retenção em dias), do mais fino ao mais grosso
+LEVELS = [(0, HISTORY_RAW_DAYS), (60, HISTORY_1M_DAYS), (900, HISTORY_15M_DAYS), (3600, HISTORY_1H_DAYS)]
+
+# Séries com histórico: tabela bruta, tabela de agregados e colunas que identificam a série
+SERIES = {
+    'measurement': ('measurement', 'measurement_rollup', 'device_id, attr'),
+    'dispatch': ('dispatch', 'dispatch_rollup', 'setup_id, attr'),
+}
+
+INSERT_DISPATCH = """
+    INSERT INTO dispatch (setup_id, attr, ts, value) VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE value = VALUES(value)
+"""
+
+dispatch_writer = BatchWriter(INSERT_DISPATCH, 'dispatch', interval=5)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def record_dispatch(setup_id, values, ts=None):
+    """Queue the per-cycle values of a setup ({attr: number}) for the dispatch history."""
+    ts = ts or datetime.utcnow()
+    return dispatch_writer.add([(setup_id, attr, ts, float(value)) for attr, value in values.items()
+                                if value is not None])
+
+
+def to_days(day):
+    # TO_DAYS do MySQL conta a partir do ano 0; date.toordinal a partir do ano 1
+    return day.toordinal() + 365
+
+
+def floor_bucket(moment, resolution):
+    seconds = (moment - EPOCH).total_seconds()
+    return EPOCH + timedelta(seconds=seconds // resolution * resolution)
+
+
+def roll_up(cursor, series, resolution, source, since, until):
+    """Recompute the `resolution` buckets in [since, until) from the raw rows (source 0) or a finer rollup."""
+    raw, rollup, key = SERIES[series]
+    if source == 0:
+        select = f"""
+        SELECT %s, {key}, FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP(ts) / %s) * %s) AS b,
+               COUNT(value), SUM(value), MIN(value), MAX(value)
+        FROM {raw} WHERE ts >= %s AND ts < %s AND value IS NOT NULL
+        GROUP BY {key}, b
+        """
+        values = (resolution, resolution, resolution, since, until)
+    else:
+        select = f"""
+        SELECT %s, {key}, FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP(bucket) / %s) * %s) AS b,
+               SUM(samples), SUM(total), MIN(min_value), MAX(max_value)
+        FROM {rollup} WHERE resolution = %s AND bucket >= %s AND bucket < %s
+        GROUP BY {key}, b
+        """
+        values = (resolution, resolution, resolution, source, since, until)
+    cursor.execute(f"""
+    INSERT INTO {rollup} (resolution, {key}, bucket, samples, total, min_value, max_value)
+    {select}
+    ON DUPLICATE KEY UPDATE samples = VALUES(samples), total = VALUES(total),
+                            min_value = VALUES(min_value), max_value = VALUES(max_value)
+    """, values)
+
+
+def load_watermark(cursor, series):
+    """Time up to which `series` is rolled up at every level, or None before its first run."""
+    cursor.execute("SELECT done_until FROM history_watermark WHERE series = %s", (series,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def save_watermark(cursor, series, done_until):
+    cursor.execute("""
+    INSERT INTO history_watermark (series, done_until) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE done_until = VALUES(done_until)
+    """, (series, done_until))
+
+
+def enforce_retention(conn, cursor, now, batch=10000):
+    for raw, rollup, key in SERIES.values():
+        for resolution, days in LEVELS[1:]:
+            # Em lotes, com commit a cada um, para não segurar locks por muito tempo
+            while True:
+                cursor.execute(f"DELETE FROM {rollup} WHERE resolution = %s AND bucket < %s LIMIT {batch}",
+                               (resolution, now - timedelta(days=days)))
+                deleted = cursor.rowcount
+                conn.commit()
+                if deleted < batch:
+                    break
+
+
+def maintain_partitions(cursor, table, keep_days, today=None, ahead=PARTITIONS_AHEAD):
+    """Create the daily partitions of the next `ahead` days and drop the ones older than `keep_days`."""
+    today = today or datetime.utcnow().date()
+    cursor.execute("""
+    SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+    ORDER BY PARTITION_ORDINAL_POSITION
+    """, (table,))
+    bounded = [(name, int(bound)) for name, bound in cursor.fetchall() if bound != 'MAXVALUE']
+    if not bounded:
+        return
+    last = max(bound for _, bound in bounded)
+    target = to_days(today + timedelta(days=ahead + 1))
+    new = []
+    while last < target:
+        day = date.fromordinal(last - 365)
+        new.append(f"PARTITION p{day:%Y%m%d} VALUES LESS THAN ({last + 1})")
+        last += 1
+    if new:
+        cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION p_future INTO "
+                       f"({', '.join(new)}, PARTITION p_future VALUES LESS THAN MAXVALUE)")
+    cutoff = to_days(today - timedelta(days=keep_days))
+    expired = [name for name, bound in bounded if bound <= cutoff]
+    if expired:
+        cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}")
+
+
+class HistoryMaintainer:
+    """
+    Background rollups, retention and partition maintenance of the history.
+
+    Every run recomputes the 1 min, 15 min and 1 h buckets touched in the
+    last HISTORY_LATE seconds before the series watermark, each level from
+    the one below it (a series without a watermark covers the whole raw
+    retention). The watermark is saved in the transaction of the last
+    rollup window, so restarts resume where the previous run stopped. An
+    advisory lock keeps a single instance working at a time.
+    """
+
+    def __init__(self, interval=HISTORY_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self.stats = {'runs': 0, 'errors': 0, 'last_s': 0.0}
+
+    def run_once(self, now=None):
+        now = now or datetime.utcnow()
+        start = time.monotonic()
+        conn = mysql.connector.connect(**connection_params())
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (LOCK_NAME,))
+            if cursor.fetchone()[0] != 1:
+                return False
+            try:
+                # Buckets em UTC, como os timestamps gravados
+                cursor.execute("SET time_zone = '+00:00'")
+                for series in SERIES:
+                    done_until = load_watermark(cursor, series)
+                    if done_until is None:
+                        begin = now - timedelta(days=HISTORY_RAW_DAYS)
+                    else:
+                        begin = min(done_until, now) - timedelta(seconds=HISTORY_LATE)
+                    source = 0
+                    for resolution, _ in LEVELS[1:]:
+                        since = floor_bucket(begin, resolution)
+                        # Janelas de até 6 h por transação
+                        while since < now:
+                            until = min(since + timedelta(hours=6), now)
+                            roll_up(cursor, series, resolution, source, since, until)
+                            if resolution == LEVELS[-1][0] and until == now:
+                                save_watermark(cursor, series, now)
+                            conn.commit()
+                            since = until
+                        source = resolution
+                enforce_retention(conn, cursor, now)
+                for raw, rollup, key in SERIES.values():
+                    maintain_partitions(cursor, raw, HISTORY_RAW_DAYS, now.date())
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+                cursor.fetchone()
+        finally:
+            cursor.close()
+            conn.close()
+        self.stats['runs'] += 1
+        self.stats['last_s'] = time.monotonic() - start
+        return True
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"Erro na manutenção do histórico: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        thread = threading.Thread(target=self.run_forever, name='history-maintainer', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+
+def choose_level(start, resolution, now=None):
+    """
+    Coarsest level not coarser than `resolution` (s) whose retention still
+    covers `start`; if none does, the finest level that still covers it.
+    """
+    age = ((now or datetime.utcnow()) - start).total_seconds() / 86400
+    covering = [level for level, days in LEVELS if days >= age]
+    fitting = [level for level in covering if level <= resolution]
+    if fitting:
+        return max(fitting)
+    return min(covering) if covering else LEVELS[-1][0]
+
+
+def _series(rows, key, raw):
+    result = {}
+    for row in rows:
+        points = result.setdefault(row[key], {}).setdefault(row['attr'], [])
+        if raw:
+            points.append([row['ts'].isoformat() + 'Z', row['value'], row['value'], row['value']])
+        else:
+            points.append([row['bucket'].isoformat() + 'Z', row['total'] / row['samples'],
+                           row['min_value'], row['max_value']])
+    return result
+
+
+def query_history(setup_id, device_ids, start, end, resolution=None):
+    """
+    History of a setup's devices and dispatch between `start` and `end` (naive UTC).
+
+    Every point is [ts, avg, min, max]; raw readings repeat the value.
+    """
+    resolution = resolution or max((end - start).total_seconds() / HISTORY_MAX_POINTS, 1)
+    level = choose_level(start, resolution)
+    conn = get_db_connection()
+    if conn is None:
+        raise ConnectionError("Failed to connect to the database")
+    cursor = conn.cursor(dictionary=True)
+    try:
+        measurements = {}
+        if device_ids:
+            placeholders = ', '.join(['%s'] * len(device_ids))
+            if level == 0:
+                cursor.execute(f"""
+                SELECT device_id, attr, ts, value FROM measurement
+                WHERE device_id IN ({placeholders}) AND ts >= %s AND ts < %s AND value IS NOT NULL
+                ORDER BY device_id, attr, ts
+                """, (*device_ids, start, end))
+            else:
+                cursor.execute(f"""
+                SELECT device_id, attr, bucket, samples, total, min_value, max_value FROM measurement_rollup
+                WHERE resolution = %s AND device_id IN ({placeholders}) AND bucket >= %s AND bucket < %s
+                ORDER BY device_id, attr, bucket
+                """, (level, *device_ids, start, end))
+            measurements = _series(cursor.fetchall(), 'device_id', level == 0)
+        if level == 0:
+            cursor.execute("""
+            SELECT setup_id, attr, ts, value FROM dispatch
+            WHERE setup_id = %s AND ts >= %s AND ts < %s ORDER BY attr, ts
+            """, (setup_id, start, end))
+        else:
+            cursor.execute("""
+            SELECT setup_id, attr, bucket, samples, total, min_value, max_value FROM dispatch_rollup
+            WHERE resolution = %s AND setup_id = %s AND bucket >= %s AND bucket < %s ORDER BY attr, bucket
+            """, (level, setup_id, start, end))
+        dispatch = _series(cursor.fetchall(), 'setup_id', level == 0).get(setup_id, {})
+    finally:
+        cursor.close()
+        conn.close()
+    return {'setup_id': setup_id, 'resolution': level, 'start': start.isoformat() + 'Z',
+            'end': end.isoformat() + 'Z', 'devices': measurements, 'dispatch': dispatch}
@@ -0,0 +1,56 @@
+from collections import namedtuple
+import threading
+import time
+
+# Valor mais recente de um atributo: `ts` é o instante da leitura no dispositivo (se conhecido),
+# `received_at` quando ela chegou aqui (epoch)
+Entry = namedtuple('Entry', ['value', 'ts', 'received_at'])
+
+
+class LatestStore:
+    """
+    Latest value per (device_id, attr), with O(1) reads and writes.
+
+    A reading older than the stored one (by device timestamp) is ignored, so
+    out-of-order deliveries never move a device back in time. get() with
+    `max_age` only returns entries received less than that many seconds ago.
+    """
+
+    def __init__(self):
+        # device_id -> {attr: Entry}: leitura de um atributo ou de um dispositivo inteiro em O(1)
+        self._entries = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._stats = {'writes': 0, 'stale_writes': 0, 'hits': 0, 'misses': 0}
+
+    def put(self, device_id, attr, value, ts=None, received_at=None):
+        entry = Entry(value, ts, time.time() if received_at is None else received_at)
+        with self._lock:
+            attrs = self._entries.setdefault(device_id, {})
+            current = attrs.get(attr)
+            if current is not None and ts is not None and current.ts is not None and ts < current.ts:
+                self._stats['stale_writes'] += 1
+                return False
+            if current is None:
+                self._count += 1
+            attrs[attr] = entry
+            self._stats['writes'] += 1
+            return True
+
+    def get(self, device_id, attr, max_age=None):
+        with self._lock:
+            entry = self._entries.get(device_id, {}).get(attr)
+            if entry is None or (max_age is not None and time.time() - entry.received_at > max_age):
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            return entry
+
+    def device(self, device_id):
+        """Every attribute stored for a device, as {attr: Entry}."""
+        with self._lock:
+            return dict(self._entries.get(device_id, {}))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=self._count)
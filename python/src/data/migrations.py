@@ -0,0 +1,409 @@
+from data.pool import connection_params
+from datetime import datetime, timedelta
+import mysql.connector
+import threading
+import time
+
+# Nome do lock consultivo do MySQL que serializa as migrações entre workers/containers
+LOCK_NAME = 'secondlayer_schema_migrations'
+LOCK_TIMEOUT = 60  # s
+
+
+def _baseline_schema(cursor):
+    # Esquema original; as verificações permitem adotar bancos criados antes do controle de versão
+    # Tabela "setup"
+    cursor.execute("SHOW TABLES LIKE 'setup'")
+    if not cursor.fetchone():
+        cursor.execute("""
+        CREATE TABLE setup (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            Pmax FLOAT NOT NULL CHECK (Pmax > 0),
+            Vnom FLOAT NOT NULL CHECK (Vnom > 0),
+            controllable ENUM('none', 'hourly', 'voltage') NOT NULL
+        )
+        """)
+        # print("Tabela 'setup' criada com sucesso!")
+    
+    
+    # Tabela "EVCS"
+    cursor.execute("SHOW TABLES LIKE 'EVCS'")
+    if not cursor.fetchone():
+        cursor.execute("""
+        CREATE TABLE EVCS (
+            id VARCHAR(255) NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            setup_id INT NOT NULL,
+            nconn INT NOT NULL CHECK (nconn IN (1, 2, 3)),
+            control ENUM('none', 'power', 'current') NOT NULL,
+            conn1_type ENUM('AC', 'DC'),
+            conn1_Pmax FLOAT CHECK (conn1_Pmax > 0),
+            conn1_Vnom FLOAT CHECK (conn1_Vnom > 0),
+            conn1_Imax FLOAT CHECK (conn1_Imax > 0),
+            conn2_type ENUM('AC', 'DC'),
+            conn2_Pmax FLOAT CHECK (conn2_Pmax > 0),
+            conn2_Vnom FLOAT CHECK (conn2_Vnom > 0),
+            conn2_Imax FLOAT CHECK (conn2_Imax > 0),
+            conn3_type ENUM('AC', 'DC'),
+            conn3_Pmax FLOAT CHECK (conn3_Pmax > 0),
+            conn3_Vnom FLOAT CHECK (conn3_Vnom > 0),
+            conn3_Imax FLOAT CHECK (conn3_Imax > 0),
+            PRIMARY KEY (id),
+            FOREIGN KEY (setup_id) REFERENCES setup(id) ON DELETE CASCADE
+        )
+        """)
+        # print("Tabela 'EVCS' criada com sucesso!")
+
+        # Criando os gatilhos para garantir a consistência dos dados com base em nconn
+        cursor.execute("""
+        CREATE TRIGGER before_insert_EVCS BEFORE INSERT ON EVCS
+        FOR EACH ROW
+        BEGIN
+            IF NEW.nconn = 1 THEN
+                IF NEW.conn2_type IS NOT NULL OR NEW.conn3_type IS NOT NULL THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Only conn1 should be filled when nconn is 1.';
+                END IF;
+            ELSEIF NEW.nconn = 2 THEN
+                IF NEW.conn1_type IS NULL OR NEW.conn2_type IS NULL OR NEW.conn3_type IS NOT NULL THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Only conn1 and conn2 should be filled when nconn is 2.';
+                END IF;
+            ELSEIF NEW.nconn = 3 THEN
+                IF NEW.conn1_type IS NULL OR NEW.conn2_type IS NULL OR NEW.conn3_type IS NULL THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'conn1, conn2, and conn3 must all be filled when nconn is 3.';
+                END IF;
+            END IF;
+        END;
+        """)
+        # print("Gatilhos para a tabela 'EVCS' criados com sucesso!")
+   
+
+    # Tabela V2G EVCS
+    cursor.execute("SHOW TABLES LIKE 'V2G'")
+    if not cursor.fetchone():
+        # Create the V2G table with corrected check constraints
+        cursor.execute("""
+        CREATE TABLE V2G (
+            id VARCHAR(255) NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            setup_id INT NOT NULL,
+            nconn INT NOT NULL CHECK (nconn IN (1, 2, 3)),
+            control ENUM('none', 'power', 'current') NOT NULL,
+            conn1_type ENUM('AC', 'DC'),
+            conn1_Pmax FLOAT CHECK (conn1_Pmax > 0),
+            conn1_Vnom FLOAT CHECK (conn1_Vnom > 0),
+            conn1_Imax FLOAT CHECK (conn1_Imax > 0),
+            conn2_type ENUM('AC', 'DC'),
+            conn2_Pmax FLOAT CHECK (conn2_Pmax > 0),
+            conn2_Vnom FLOAT CHECK (conn2_Vnom > 0),
+            conn2_Imax FLOAT CHECK (conn2_Imax > 0),
+            conn3_type ENUM('AC', 'DC'),
+            conn3_Pmax FLOAT CHECK (conn3_Pmax > 0),
+            conn3_Vnom FLOAT CHECK (conn3_Vnom > 0),
+            conn3_Imax FLOAT CHECK (conn3_Imax > 0),
+            PRIMARY KEY (id),
+            FOREIGN KEY (setup_id) REFERENCES setup(id) ON DELETE CASCADE
+        )""")
+        # print("Tabela 'V2G' criada com sucesso!")
+
+        # Creating triggers to ensure data consistency based on nconn
+        cursor.execute("""
+        CREATE TRIGGER before_insert_V2G BEFORE INSERT ON V2G
+        FOR EACH ROW
+        BEGIN
+            IF NEW.nconn = 1 THEN
+                IF NEW.conn2_type IS NOT NULL OR NEW.conn3_type IS NOT NULL THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Only conn1 should be filled when nconn is 1.';
+                END IF;
+            ELSEIF NEW.nconn = 2 THEN
+                IF NEW.conn1_type IS NULL OR NEW.conn2_type IS NULL OR NEW.conn3_type IS NOT NULL THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Only conn1 and conn2 should be filled when nconn is 2.';
+                END IF;
+            ELSEIF NEW.nconn = 3 THEN
+                IF NEW.conn1_type IS NULL OR NEW.conn2_type IS NULL OR NEW.conn3_type IS NULL THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'conn1, conn2, and conn3 must all be filled when nconn is 3.';
+                END IF;
+            END IF;
+        END;
+        """)
+        # print("Gatilhos para a tabela 'V2G' criados com sucesso!")
+
+    # Tabela "BESS"
+    cursor.execute("SHOW TABLES LIKE 'BESS'")
+    if not cursor.fetchone():
+        cursor.execute("""
+        CREATE TABLE BESS (
+            id VARCHAR(255) NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            setup_id INT NOT NULL,
+            eff FLOAT NOT NULL CHECK (eff >= 0 AND eff <= 1),
+            Pmax FLOAT NOT NULL CHECK (Pmax > 0),
+            Emax FLOAT NOT NULL CHECK (Emax > 0),
+            PRIMARY KEY (id),
+            FOREIGN KEY (setup_id) REFERENCES setup(id) ON DELETE CASCADE
+        )
+        """)
+        # print("Tabela 'BESS' criada com sucesso!")
+   
+
+    # Tabela "PV"
+    cursor.execute("SHOW TABLES LIKE 'PV'")
+    if not cursor.fetchone():
+        cursor.execute("""
+        CREATE TABLE PV (
+            id VARCHAR(255) NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            setup_id INT NOT NULL,
+            eff FLOAT NOT NULL CHECK (eff >= 0 AND eff <= 1),
+            Pmax FLOAT NOT NULL CHECK (Pmax > 0),
+            PRIMARY KEY (id),
+            FOREIGN KEY (setup_id) REFERENCES setup(id) ON DELETE CASCADE
+        )
+        """)
+        # print("Tabela 'PV' criada com sucesso!")
+    # else:
+        # print("Tabela 'PV' já existe.")
+
+    # Criação da tabela "TimeConfig"
+    cursor.execute("SHOW TABLES LIKE 'TimeConfig'")
+    if not cursor.fetchone():
+        cursor.execute("""
+        CREATE TABLE TimeConfig (
+            id INT PRIMARY KEY,
+            URL VARCHAR(255) NOT NULL,
+            timestep INT NOT NULL,
+            tmin_d VARCHAR(5) NOT NULL,
+            tmax_d VARCHAR(5) NOT NULL,
+            tmin_c VARCHAR(5) NOT NULL,
+            tmax_c VARCHAR(5) NOT NULL,
+            UNIQUE (URL, timestep)
+        )
+        """)
+        # print("Tabela 'TimeConfig' criada com sucesso!")
+        # Inserir valores pré-definidos
+        cursor.execute("""
+        INSERT INTO TimeConfig (id, URL, timestep, tmin_d, tmax_d, tmin_c, tmax_c) VALUES
+        (1, 'https://platmobele.cpqd.com.br/cpqd-manager/rest/containers/deviceHistory/processes/deviceHistory.deviceHistory/variables/Result', 
+        5, '18:00', '21:00', '03:00', '05:00')
+        """)
+
+
+def _index_exists(cursor, table, index):
+    cursor.execute("""
+    SELECT 1 FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    LIMIT 1
+    """, (table, index))
+    return cursor.fetchone() is not None
+
+
+def _create_index(cursor, table, index, columns):
+    if not _index_exists(cursor, table, index):
+        cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+
+
+def _device_setup_indexes(cursor):
+    # Índices explícitos para as consultas por setup_id (listagens filtradas e otimizador);
+    # o índice implícito criado pela chave estrangeira passa a ser coberto por estes
+    for table in ('EVCS', 'V2G', 'BESS', 'PV'):
+        _create_index(cursor, table, f'idx_{table.lower()}_setup_id', 'setup_id')
+
+
+def _measurement_table(cursor):
+    # Leituras enviadas pela plataforma/gateways (POST /telemetry); sem chave estrangeira para
+    # aceitar dispositivos ainda não cadastrados. Valores numéricos em `value`, os demais em `data`
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS measurement (
+        device_id VARCHAR(255) NOT NULL,
+        attr VARCHAR(64) NOT NULL,
+        ts DATETIME(3) NOT NULL,
+        value DOUBLE NULL,
+        data JSON NULL,
+        PRIMARY KEY (device_id, attr, ts)
+    )
+    """)
+
+
+def _partitioned(cursor, table):
+    cursor.execute("""
+    SELECT COUNT(*) FROM information_schema.PARTITIONS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+    """, (table,))
+    return cursor.fetchone()[0] > 0
+
+
+def _daily_partitions():
+    # Partição inicial até amanhã mais a partição aberta; as diárias são criadas por data.history
+    tomorrow = (datetime.utcnow().date() + timedelta(days=1)).isoformat()
+    return (f"PARTITION BY RANGE (TO_DAYS(ts)) (PARTITION p_start VALUES LESS THAN (TO_DAYS('{tomorrow}')), "
+            f"PARTITION p_future VALUES LESS THAN MAXVALUE)")
+
+
+def _history_tables(cursor):
+    # Séries temporais particionadas por dia (retenção por DROP PARTITION) e agregados por resolução
+    if not _partitioned(cursor, 'measurement'):
+        cursor.execute(f"ALTER TABLE measurement {_daily_partitions()}")
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS dispatch (
+        setup_id INT NOT NULL,
+        attr VARCHAR(64) NOT NULL,
+        ts DATETIME(3) NOT NULL,
+        value DOUBLE NOT NULL,
+        PRIMARY KEY (setup_id, attr, ts)
+    ) {_daily_partitions()}
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS measurement_rollup (
+        resolution INT NOT NULL,
+        device_id VARCHAR(255) NOT NULL,
+        attr VARCHAR(64) NOT NULL,
+        bucket DATETIME NOT NULL,
+        samples INT NOT NULL,
+        total DOUBLE NOT NULL,
+        min_value DOUBLE NOT NULL,
+        max_value DOUBLE NOT NULL,
+        PRIMARY KEY (resolution, device_id, attr, bucket)
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS dispatch_rollup (
+        resolution INT NOT NULL,
+        setup_id INT NOT NULL,
+        attr VARCHAR(64) NOT NULL,
+        bucket DATETIME NOT NULL,
+        samples INT NOT NULL,
+        total DOUBLE NOT NULL,
+        min_value DOUBLE NOT NULL,
+        max_value DOUBLE NOT NULL,
+        PRIMARY KEY (resolution, setup_id, attr, bucket)
+    )
+    """)
+
+
+def _dispatch_audit_table(cursor):
+    # Registro por ciclo e setup do que o otimizador decidiu e do que os dispositivos aceitaram
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS dispatch_audit (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        cycle_at DATETIME(3) NOT NULL,
+        setup_id INT NOT NULL,
+        status VARCHAR(16) NOT NULL,
+        branch VARCHAR(32) NULL,
+        Ptotal DOUBLE NULL,
+        PEV DOUBLE NULL,
+        PPV DOUBLE NULL,
+        setpoints JSON NOT NULL,
+        timings JSON NOT NULL,
+        error TEXT NULL,
+        KEY idx_dispatch_audit_setup (setup_id, cycle_at)
+    )
+    """)
+
+
+def _registry_version(cursor):
+    # Contador incrementado a cada escrita no cadastro; os workers da API comparam com o
+    # valor que conhecem para descartar o cache de setups, dispositivos e TimeConfig
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS registry_version (
+        id TINYINT PRIMARY KEY,
+        version BIGINT NOT NULL
+    )
+    """)
+    cursor.execute("INSERT IGNORE INTO registry_version (id, version) VALUES (1, 0)")
+
+
+def _history_watermark(cursor):
+    # Até onde cada série já foi agregada em todos os níveis, gravado junto com os agregados
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS history_watermark (
+        series VARCHAR(64) PRIMARY KEY,
+        done_until DATETIME NOT NULL
+    )
+    """)
+
+
+# Lista ordenada de migrações: (versão, descrição, função que recebe o cursor)
+# Novas alterações de esquema (índices, colunas) entram sempre no final com a próxima versão
+MIGRATIONS = [
+    (1, 'baseline schema', _baseline_schema),
+    (2, 'setup_id indexes on device tables', _device_setup_indexes),
+    (3, 'measurement table for pushed telemetry', _measurement_table),
+    (4, 'partitioned history tables and rollups', _history_tables),
+    (5, 'dispatch audit log', _dispatch_audit_table),
+    (6, 'registry version counter for API caches', _registry_version),
+    (7, 'rollup watermark of the history series', _history_watermark),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INT PRIMARY KEY,
+        description VARCHAR(255) NOT NULL,
+        applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cursor.execute("SELECT MAX(version) FROM schema_version")
+    row = cursor.fetchone()
+    return row[0] or 0
+
+
+def migrate():
+    """Apply every pending migration, returning the resulting schema version."""
+    # Conexão dedicada: DDL faz commit implícito e o lock consultivo pertence à sessão
+    raw = mysql.connector.connect(**connection_params())
+    cursor = raw.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError("Timed out waiting for the schema migration lock")
+        try:
+            version = current_version(cursor)
+            for number, description, apply in MIGRATIONS:
+                if number <= version:
+                    continue
+                print(f"Applying schema migration {number}: {description}")
+                apply(cursor)
+                cursor.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                               (number, description))
+                raw.commit()
+                version = number
+            return version
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            cursor.fetchone()
+    finally:
+        cursor.close()
+        raw.close()
+
+
+_ready = False
+_ready_lock = threading.Lock()
+_last_attempt = 0
+RETRY_INTERVAL = 10  # s entre tentativas quando o banco ainda não está disponível
+
+
+def ensure_schema():
+    """
+    Run the migrations once per process.
+
+    After the first success this is a flag check with no database access, so
+    it is cheap enough to be called from a request hook.
+    """
+    global _ready, _last_attempt
+    if _ready:
+        return True
+    with _ready_lock:
+        if _ready:
+            return True
+        now = time.monotonic()
+        if _last_attempt and now - _last_attempt < RETRY_INTERVAL:
+            return False
+        _last_attempt = now
+        try:
+            migrate()
+            _ready = True
+        except Exception as err:
+            print(f"Erro ao aplicar as migrações do banco de dados: {err}")
+    return _ready
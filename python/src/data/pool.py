@@ -0,0 +1,240 @@
+from mysql.connector import Error
+import mysql.connector
+import threading
+import time
+import os
+
+# Tamanho do pool por worker uWSGI (conexões mantidas abertas)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+# Conexões extras permitidas quando o pool está todo em uso (fechadas ao devolver)
+DB_POOL_OVERFLOW = int(os.getenv('DB_POOL_OVERFLOW', 10))
+# Conexões ociosas há mais tempo que isso (s) são descartadas
+DB_POOL_IDLE_TIMEOUT = float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300))
+# Conexões ociosas há menos tempo que isso (s) não recebem ping no checkout
+DB_POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', 30))
+# Tempo máximo de espera (s) por uma conexão quando pool e overflow estão esgotados
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+
+
+def connection_params():
+    # Lê as variáveis de ambiente necessárias para a conexão
+    return {
+        'user': os.getenv('MYSQL_USER', 'root'),  # Define 'root' como padrão se MYSQL_USER não estiver definido
+        'password': os.getenv('MYSQL_ROOT_PASSWORD'),
+        'host': os.getenv('MYSQL_HOST', 'localhost'),  # Define 'localhost' como padrão se MYSQL_HOST não estiver definido
+        'port': os.getenv('MYSQL_PORT', '3306'),  # Define '3306' como padrão se MYSQL_PORT não estiver definido
+        'database': os.getenv('MYSQL_DATABASE'),
+    }
+
+
+class PooledConnection:
+    """
+    Proxy for a pooled MySQL connection.
+
+    Behaves like the underlying connection, but close() hands the connection
+    back to the pool instead of closing the socket, so existing handlers keep
+    their connect/close pattern unchanged.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get('_raw')
+        if raw is None:
+            raise Error(msg="Connection already returned to the pool")
+        return getattr(raw, name)
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        # Handlers that abort before close() would otherwise leak the slot
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Per-process pool of MySQL connections.
+
+    Keeps up to `size` idle connections, allows `overflow` extra connections
+    under bursts, pings connections that were idle for a while before handing
+    them out and drops connections idle for longer than `idle_timeout`.
+    """
+
+    def __init__(self, size=DB_POOL_SIZE, overflow=DB_POOL_OVERFLOW, idle_timeout=DB_POOL_IDLE_TIMEOUT,
+                 ping_after=DB_POOL_PING_AFTER, timeout=DB_POOL_TIMEOUT, params=None):
+        self.size = size
+        self.overflow = overflow
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self.timeout = timeout
+        self.params = params or connection_params()
+        self._idle = []  # pilha de (conexão, instante em que foi devolvida)
+        self._open = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'reused': 0,
+            'evicted_idle': 0,
+            'failed_health_checks': 0,
+            'discarded': 0,
+            'waits': 0,
+            'errors': 0,
+        }
+
+    def _count(self, key, n=1):
+        with self._cond:
+            self._stats[key] += n
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.params)
+        self._count('created')
+        return raw
+
+    def _evict_idle(self, now):
+        # Chamado com o lock adquirido; as conexões mais antigas ficam no início da pilha
+        expired = []
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.pop(0)[0])
+        self._open -= len(expired)
+        self._stats['evicted_idle'] += len(expired)
+        return expired
+
+    def _checkout_raw(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                expired = self._evict_idle(now)
+                if self._idle:
+                    raw, released_at = self._idle.pop()
+                    idle_for = now - released_at
+                    create = False
+                elif self._open < self.size + self.overflow:
+                    self._open += 1
+                    raw, idle_for, create = None, 0, True
+                else:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats['errors'] += 1
+                        raise Error(msg="Timed out waiting for a database connection from the pool")
+                    self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+                    continue
+            self._close_quietly(expired)
+
+            if create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._stats['errors'] += 1
+                        self._cond.notify()
+                    raise
+
+            # Health check no checkout, apenas se a conexão ficou ociosa por algum tempo
+            if idle_for < self.ping_after:
+                self._count('reused')
+                return raw
+            try:
+                raw.ping(reconnect=False)
+                self._count('reused')
+                return raw
+            except Exception:
+                self._count('failed_health_checks')
+                self._discard(raw)
+
+    def get_connection(self):
+        raw = self._checkout_raw()
+        self._count('checkouts')
+        return PooledConnection(self, raw)
+
+    def release(self, raw):
+        # Desfaz transações pendentes para que a próxima requisição receba uma conexão limpa
+        try:
+            if raw.unread_result:
+                raw.consume_results()
+            if raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            self._discard(raw)
+            return
+
+        with self._cond:
+            if len(self._idle) < self.size:
+                self._idle.append((raw, time.monotonic()))
+                self._cond.notify()
+                return
+            self._open -= 1
+            self._cond.notify()
+        self._close_quietly([raw])
+
+    def _discard(self, raw):
+        with self._cond:
+            self._open -= 1
+            self._stats['discarded'] += 1
+            self._cond.notify()
+        self._close_quietly([raw])
+
+    @staticmethod
+    def _close_quietly(connections):
+        for raw in connections:
+            try:
+                raw.close()
+            except Exception:
+                pass
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        self._close_quietly(raw for raw, _ in idle)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self.size,
+                'overflow': self.overflow,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+            })
+        return stats
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the pool of the current process, creating it after a fork if needed."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                # Conexões herdadas do master (uWSGI sem lazy-apps) não podem ser compartilhadas
+                _pool = ConnectionPool()
+                _pool_pid = pid
+    return _pool
+
+
+def pool_stats():
+    return get_pool().stats()
@@ -0,0 +1,125 @@
+from collections import OrderedDict
+from data.check import get_db_connection
+import threading
+import time
+import os
+
+# Entradas mantidas por worker (as menos usadas saem primeiro)
+REGISTRY_CACHE_SIZE = int(os.getenv('REGISTRY_CACHE_SIZE', 2000))
+# Intervalo (s) entre consultas ao contador de versão no MySQL: alterações feitas por outros
+# workers aparecem em no máximo esse tempo (0 consulta a cada leitura, negativo desativa o cache)
+REGISTRY_CACHE_CHECK = float(os.getenv('REGISTRY_CACHE_CHECK', 2))
+
+
+class RegistryCache:
+    """
+    Read-through cache of registry reads (setups, devices, TimeConfig).
+
+    Entries are dropped as a whole when this worker writes to the registry
+    (invalidate(), which also bumps the registry_version row) or when that
+    row changed since the last check, so the writes of other workers are
+    seen within `check_interval` seconds. Between checks, repeated reads do
+    not touch the database.
+    """
+
+    def __init__(self, size=REGISTRY_CACHE_SIZE, check_interval=REGISTRY_CACHE_CHECK):
+        self.size = size
+        self.check_interval = check_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        # Incrementado a cada invalidação: leituras iniciadas antes dela não são guardadas
+        self._generation = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0,
+                       'version_checks': 0, 'version_errors': 0}
+
+    def _read_version(self):
+        conn = get_db_connection()
+        if conn is None:
+            raise ConnectionError("Failed to connect to the database")
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT version FROM registry_version WHERE id = 1")
+            row = cursor.fetchone()
+            return row[0] if row else None
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _current(self):
+        """Check the shared version when due; False if the cache cannot be trusted right now."""
+        now = time.monotonic()
+        with self._lock:
+            if self._version is not None and now - self._checked_at < self.check_interval:
+                return True
+        try:
+            version = self._read_version()
+        except Exception:
+            # Sem o contador (banco fora ou migração pendente) lê sempre do banco
+            with self._lock:
+                self._stats['version_errors'] += 1
+                self._version = None
+                self._entries.clear()
+            return False
+        with self._lock:
+            self._stats['version_checks'] += 1
+            if version != self._version:
+                self._entries.clear()
+                self._generation += 1
+                self._version = version
+            self._checked_at = now
+            return version is not None
+
+    def get(self, key, loader):
+        """Cached value of `key`, calling `loader()` on a miss; None results are not cached."""
+        if self.check_interval < 0 or not self._current():
+            return loader()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return self._entries[key]
+            self._stats['misses'] += 1
+            generation = self._generation
+        value = loader()
+        if value is None:
+            return value
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = value
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+                    self._stats['evictions'] += 1
+        return value
+
+    def invalidate(self, shared=True):
+        """Drop every entry; with `shared`, bump the version so the other workers drop theirs too."""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._version = None
+            self._stats['invalidations'] += 1
+        if not shared:
+            return
+        conn = get_db_connection()
+        if conn is None:
+            return
+        cursor = conn.cursor()
+        try:
+            cursor.execute("UPDATE registry_version SET version = version + 1 WHERE id = 1")
+            conn.commit()
+        except Exception as e:
+            print(f"Erro ao incrementar a versão do cadastro: {e}")
+        finally:
+            cursor.close()
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(self._stats, entries=len(self._entries), size=self.size, version=self._version,
+                        hit_ratio=self._stats['hits'] / lookups if lookups else None)
+
+
+cache = RegistryCache()
@@ -0,0 +1,125 @@
+from data.check import get_db_connection
+
+# Acesso direto ao cadastro (setups, dispositivos, TimeConfig) sobre o mesmo pool
+# e esquema usados pela API, sem passar por nginx/uWSGI/Flask-RESTX.
+
+SETUP_COLUMNS = ['id', 'name', 'Pmax', 'Vnom', 'controllable']
+
+CONNECTOR_COLUMNS = ['id', 'name', 'setup_id', 'nconn', 'control',
+                     'conn1_type', 'conn1_Pmax', 'conn1_Vnom', 'conn1_Imax',
+                     'conn2_type', 'conn2_Pmax', 'conn2_Vnom', 'conn2_Imax',
+                     'conn3_type', 'conn3_Pmax', 'conn3_Vnom', 'conn3_Imax']
+
+DEVICE_COLUMNS = {
+    'BESS': ['id', 'name', 'setup_id', 'eff', 'Pmax', 'Emax'],
+    'PV': ['id', 'name', 'setup_id', 'eff', 'Pmax'],
+    'EVCS': CONNECTOR_COLUMNS,
+    'V2G': CONNECTOR_COLUMNS,
+}
+
+# Chave usada no dicionário agrupado de cada tipo de dispositivo
+DEVICE_KEYS = {'BESS': 'bess', 'PV': 'pv', 'EVCS': 'evcs', 'V2G': 'v2g'}
+
+# Colunas da consulta unificada: união das colunas de todos os tipos, na ordem de aparição
+_UNION_COLUMNS = []
+for _columns in DEVICE_COLUMNS.values():
+    _UNION_COLUMNS.extend(column for column in _columns if column not in _UNION_COLUMNS)
+
+
+def _in_clause(column, values):
+    return f"{column} IN ({', '.join(['%s'] * len(values))})"
+
+
+def _devices_union(setup_ids=None):
+    """UNION ALL of every device table padded to the same columns, optionally filtered by setup."""
+    selects = []
+    values = []
+    for device_type, columns in DEVICE_COLUMNS.items():
+        projection = ', '.join(column if column in columns else f"NULL AS {column}" for column in _UNION_COLUMNS)
+        select = f"SELECT '{device_type}' AS type, {projection} FROM {device_type}"
+        if setup_ids is not None:
+            select += ' WHERE ' + _in_clause('setup_id', setup_ids)
+            values.extend(setup_ids)
+        selects.append(select)
+    return '\nUNION ALL\n'.join(selects), values
+
+
+def _fetchall(query, values=()):
+    conn = get_db_connection()
+    if conn is None:
+        raise ConnectionError("Failed to connect to the database")
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(query, tuple(values))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def get_setups(setup_ids=None):
+    query = "SELECT * FROM setup"
+    if setup_ids is not None:
+        if not setup_ids:
+            return []
+        query += ' WHERE ' + _in_clause('id', setup_ids)
+    return _fetchall(query + " ORDER BY id", setup_ids or ())
+
+
+def get_setup(setup_id):
+    rows = get_setups([setup_id])
+    return rows[0] if rows else None
+
+
+def get_devices(device_type, setup_id):
+    """Devices of one type (BESS, PV, EVCS, V2G) belonging to a setup."""
+    if device_type not in DEVICE_COLUMNS:
+        raise ValueError(f"Unknown device type {device_type}")
+    return _fetchall(f"SELECT * FROM {device_type} WHERE setup_id = %s ORDER BY id", (setup_id,))
+
+
+def load_setups_with_devices(setup_ids=None):
+    """
+    Load setups and all of their devices with a single query.
+
+    Returns a list of dicts with the setup columns plus the keys 'bess', 'pv',
+    'evcs' and 'v2g' holding the device rows, ordered by setup id.
+    """
+    if setup_ids is not None and not setup_ids:
+        return []
+    devices, values = _devices_union(setup_ids)
+    setup_projection = ', '.join(f"s.{column} AS s_{column}" for column in SETUP_COLUMNS)
+    device_projection = ', '.join(f"d.{column}" for column in ['type'] + _UNION_COLUMNS)
+    query = f"""
+    SELECT {setup_projection}, {device_projection}
+    FROM setup s
+    LEFT JOIN ({devices}) d ON d.setup_id = s.id
+    """
+    if setup_ids is not None:
+        query += ' WHERE ' + _in_clause('s.id', setup_ids)
+        values.extend(setup_ids)
+    query += " ORDER BY s.id, d.type, d.id"
+
+    setups = []
+    current = None
+    for row in _fetchall(query, values):
+        if current is None or current['id'] != row['s_id']:
+            current = {column: row[f's_{column}'] for column in SETUP_COLUMNS}
+            current.update({key: [] for key in DEVICE_KEYS.values()})
+            setups.append(current)
+        device_type = row['type']
+        if device_type is None:
+            # setup sem dispositivos (LEFT JOIN)
+            continue
+        current[DEVICE_KEYS[device_type]].append({column: row[column] for column in DEVICE_COLUMNS[device_type]})
+    return setups
+
+
+def get_setup_with_devices(setup_id):
+    setups = load_setups_with_devices([setup_id])
+    return setups[0] if setups else None
+
+
+def get_timeconfig(config_id):
+    rows = _fetchall("SELECT * FROM TimeConfig WHERE id = %s", (config_id,))
+    return rows[0] if rows else None
@@ -0,0 +1,88 @@
+from datetime import datetime, timezone
+from data.latest import LatestStore
+from data.batch import BatchWriter
+import json
+import math
+import os
+
+# Leituras acumuladas antes de gravar, tempo máximo (s) que uma leitura espera no buffer
+# e limite do buffer (leituras além dele são descartadas enquanto o banco não responde)
+TELEMETRY_BATCH = int(os.getenv('TELEMETRY_BATCH', 1000))
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv('TELEMETRY_FLUSH_INTERVAL', 1))
+TELEMETRY_MAX_BUFFER = int(os.getenv('TELEMETRY_MAX_BUFFER', 100000))
+
+# Intervalo aceito pela coluna DATETIME do MySQL
+TS_MIN = datetime(1000, 1, 1)
+TS_MAX = datetime(9999, 12, 31, 23, 59, 59)
+
+INSERT_MEASUREMENTS = """
+    INSERT INTO measurement (device_id, attr, ts, value, data) VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE value = VALUES(value), data = VALUES(data)
+"""
+
+
+def parse_ts(ts):
+    """Reading timestamp (ISO 8601 or epoch seconds, default now) as a naive UTC datetime."""
+    if ts is None:
+        return datetime.utcnow()
+    if isinstance(ts, (int, float)) and not isinstance(ts, bool):
+        try:
+            parsed = datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+        except (OverflowError, OSError, ValueError):
+            raise ValueError("ts is not a valid epoch timestamp")
+    elif isinstance(ts, str):
+        try:
+            parsed = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        except OverflowError:
+            raise ValueError("ts is out of range")
+    else:
+        raise ValueError("ts must be an ISO 8601 string or epoch seconds")
+    if not TS_MIN <= parsed <= TS_MAX:
+        raise ValueError("ts is out of range")
+    return parsed
+
+
+def parse_reading(reading):
+    """Validate one reading {device_id, attr, value, ts?} and return the measurement row."""
+    if not isinstance(reading, dict):
+        raise ValueError("reading must be an object")
+    device_id, attr = reading.get('device_id'), reading.get('attr')
+    if not isinstance(device_id, str) or not device_id or len(device_id) > 255:
+        raise ValueError("device_id must be a non-empty string")
+    if not isinstance(attr, str) or not attr or len(attr) > 64:
+        raise ValueError("attr must be a non-empty string of up to 64 characters")
+    if 'value' not in reading:
+        raise ValueError("value is required")
+    value = reading['value']
+    ts = parse_ts(reading.get('ts'))
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # json aceita NaN/Infinity (e inteiros enormes), que o MySQL não grava
+        try:
+            number = float(value)
+        except OverflowError:
+            number = math.inf
+        if not math.isfinite(number):
+            raise ValueError("value must be a finite number")
+        return device_id, attr, ts, number, None
+    try:
+        return device_id, attr, ts, None, json.dumps(value, allow_nan=False)
+    except ValueError:
+        raise ValueError("value must not contain NaN or Infinity")
+
+
+writer = BatchWriter(INSERT_MEASUREMENTS, 'telemetry', TELEMETRY_BATCH, TELEMETRY_FLUSH_INTERVAL, TELEMETRY_MAX_BUFFER)
+# Último valor de cada (dispositivo, atributo) recebido por este worker
+latest = LatestStore()
+
+
+def ingest(rows, values=None):
+    """Index and queue measurement rows; `values` are the original values kept in the index."""
+    for index, (device_id, attr, ts, value, data) in enumerate(rows):
+        latest.put(device_id, attr, values[index] if values is not None else value, ts)
+    return writer.add(rows)
+
+
+def stats():
+    return dict(writer.stats(), latest=latest.stats()['entries'])
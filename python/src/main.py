@@ -1,10 +1,16 @@
-from opt import software
+from opt.scheduler import Scheduler
+from opt import telemetry
+from data import history
 from datetime import datetime
-import time
-import opt
 
-while(1):
-    opt.cron_function()
-    time.sleep(5*60)
-    
-    a= 1
\ No newline at end of file
+# Processo dedicado do otimizador: mule do uWSGI (app.ini) ou sidecar (python main.py).
+# Otimização em ticks fixos do relógio; com várias instâncias só o líder executa
+print('Starting optimization scheduler - v4.2.1 ', datetime.now())
+scheduler = Scheduler()
+# Telemetria coletada em segundo plano, só enquanto esta instância é a líder; o ciclo lê o estado local
+if telemetry.TELEMETRY_INTERVAL:
+    telemetry.TelemetryPoller(active=scheduler.is_leader).start()
+# Agregados, retenção e partições do histórico
+if history.HISTORY_INTERVAL:
+    history.HistoryMaintainer().start()
+scheduler.run_forever()
@@ -1,18 +1,37 @@
 from datetime import datetime, timedelta
 from opt import software
 from opt import dojot
-import numpy as np
+from opt.client import client
+from opt import collect
+from opt import dispatch
+from opt import lp
+from opt import setpoints
+from opt import commands
+from opt import safestate
+from opt import telemetry
+from data import history
+from opt.audit import CycleAudit
+from opt.deadline import Deadline, DeadlineExceeded
+from concurrent.futures import ThreadPoolExecutor, wait
 import opt.bess
 import opt.pv
+import threading
 import time
 import os
 
 INTERVAL = os.environ.get('INTERVAL', 5) # minutes
-SECURITY_MODE = os.environ.get('SECURITY_MODE', "TRUE")
-NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE")
-
-#Define minimum power to charge a vehicle
-Pmin = 1.5 #kW
+SECURITY_MODE = os.environ.get('SECURITY_MODE', "TRUE") != 'FALSE'
+NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE") != 'FALSE'
+# Setups otimizados em paralelo e prazo de cada setup dentro do ciclo (s)
+SETUP_WORKERS = int(os.environ.get('OPT_SETUP_WORKERS', 4))
+SETUP_DEADLINE = float(os.environ.get('OPT_SETUP_DEADLINE', 0.8 * 60 * float(INTERVAL))) or None  # 0 desativa
+# Despacho de BESS e EVs: 'heuristic' (regras por janela de horário) ou 'lp' (programa linear por setup)
+SOLVER = os.environ.get('OPT_SOLVER', "heuristic").lower()
+# Setups cuja otimização do ciclo anterior ainda não terminou: não são reiniciados em paralelo
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+# Protocolo OCPP informado por cada EVCS, usado pelo set_zero (que não consulta a plataforma)
+PROTOCOLS = {}
 
 class SYSTEM:
     def __init__(self, setup):
@@ -28,59 +47,68 @@ class SYSTEM:
         self.bess_to_charge = []
         self.bess_to_discharge = []
         self.bess_half_charged = []
+        self.soc = {}
         self.pv   = []
         self.v2g  = []
         self.PPV  = 0
         self.PEV  = 0
 
     def add_devices(self, setup):
-        for evcs in software.get_evcs_by_setup_id(setup['id']):
-            self.evcs.append(evcs)
-
-        for bess in software.get_bess_by_setup_id(setup['id']):
-            self.bess.append(bess)
-
-        for pv in software.get_pv_by_setup_id(setup['id']):
-            self.pv.append(pv)
-
-        for v2g in software.get_v2g_by_setup_id(setup['id']):
-            self.v2g.append(v2g)
+        devices = software.get_setup_devices(setup['id'])
+        if devices is None:
+            raise RuntimeError(f"Failed to load devices of setup {setup['id']}")
+        self.evcs.extend(devices['evcs'])
+        self.bess.extend(devices['bess'])
+        self.pv.extend(devices['pv'])
+        self.v2g.extend(devices['v2g'])
         return
     
         
+    def read_measurements(self, device):
+        # Última leitura do coletor em segundo plano; a plataforma só é consultada se ela estiver velha
+        kind, entry = device
+        if kind == 'bess':
+            return telemetry.bess_measurements(entry)
+        return telemetry.pv_measurements(entry)
+
     def total_power(self):
         self.Ptotal = float(self.Pmax)
-        for bess in self.bess:
-            # check bess state of charge
-            response = opt.bess.get_bess_measurements(bess['id'])
-            if NOTIFICATION: print(f"Response from BESS {bess['id']}: {response}")
-            reference = datetime.now() - timedelta(minutes=5)
-            if NOTIFICATION: print(response)
-            if NOTIFICATION: print(f'reference: {reference}')
-            if response:
-                date = datetime.strptime(response['date'], "%Y-%m-%dT%H:%M:%S")
-                if date >= reference:
-                    soc = float(response['battery_level'])/100
-                    demand = (INTERVAL/60) * bess['Pmax']
-                    if soc <= 0.5:
-                        self.bess_half_charged.append(bess)
-                    if soc * bess['Emax'] > demand:
-                        self.Ptotal += bess['Pmax']
-                        self.bess_to_discharge.append(bess)
-                    else:
-                        self.bess_to_charge.append(bess)
-                                
-            
-        for pv in self.pv:
-            # check pv power generation
-            reference = datetime.now() - timedelta(minutes=10)
-            response = opt.pv.get_pv_measurements(pv['id'])
-            if response:
-                date = datetime.strptime(response['date'], "%Y-%m-%dT%H:%M:%S")
-                if datetime.strptime(response['date'], "%Y-%m-%dT%H:%M:%S") >= reference:
-                    self.Ptotal += float(response['total_DC_power'])/1000
-                    self.PPV += float(response['total_DC_power'])/1000
-                    if NOTIFICATION: print(f"PV {pv['id']} power: {float(response['total_DC_power'])}W")
+        # Leituras de BESS e PV em paralelo; o processamento segue a ordem dos dispositivos
+        devices = [('bess', bess) for bess in self.bess] + [('pv', pv) for pv in self.pv]
+        readings = collect.gather(self.read_measurements, devices)
+        for (kind, entry), response, error in readings:
+            if error is not None:
+                raise error
+            if kind == 'bess':
+                bess = entry
+                # check bess state of charge
+                if NOTIFICATION: print(f"Response from BESS {bess['id']}: {response}")
+                reference = datetime.now() - timedelta(minutes=5)
+                if NOTIFICATION: print(response)
+                if NOTIFICATION: print(f'reference: {reference}')
+                if response:
+                    date = datetime.strptime(response['date'], "%Y-%m-%dT%H:%M:%S")
+                    if date >= reference:
+                        soc = float(response['battery_level'])/100
+                        self.soc[bess['id']] = soc
+                        demand = (INTERVAL/60) * bess['Pmax']
+                        if soc <= 0.5:
+                            self.bess_half_charged.append(bess)
+                        if soc * bess['Emax'] > demand:
+                            self.Ptotal += bess['Pmax']
+                            self.bess_to_discharge.append(bess)
+                        else:
+                            self.bess_to_charge.append(bess)
+            else:
+                pv = entry
+                # check pv power generation
+                reference = datetime.now() - timedelta(minutes=10)
+                if response:
+                    date = datetime.strptime(response['date'], "%Y-%m-%dT%H:%M:%S")
+                    if date >= reference:
+                        self.Ptotal += float(response['total_DC_power'])/1000
+                        self.PPV += float(response['total_DC_power'])/1000
+                        if NOTIFICATION: print(f"PV {pv['id']} power: {float(response['total_DC_power'])}W")
         
         for v2g in self.v2g:
             # check v2g state of charge
@@ -88,12 +116,21 @@ class SYSTEM:
                 self.Ptotal += v2g[f'conn{connector}_Pmax']
     
 
+    def read_evcs_status(self, url, evcs):
+        return telemetry.evcs_status(url, evcs)
+
     def evcs_status(self):
         if NOTIFICATION: print("Checking EVCS status")
         par = software.get_timeconfig(1)
-        for evcs in self.evcs:
-            protocol, statusNotification = dojot.check_data(par["URL"], evcs['id'], "statusNotificationReq", 240)
+        # Consultas em paralelo (ritmo por host controlado pelo cliente da plataforma)
+        statuses = collect.gather(lambda evcs: self.read_evcs_status(par["URL"], evcs), self.evcs)
+        for evcs, status, error in statuses:
+            if error is not None:
+                raise error
+            protocol, statusNotification, heartbeat = status
             evcs['protocol'] = protocol
+            if protocol:
+                PROTOCOLS[evcs['id']] = protocol
             if statusNotification:
                 if protocol == "OCPP 2.0.1":
                     if statusNotification['value']['connectorStatus'] in ['Preparing', 'Charging', "Reserved"]:
@@ -106,121 +143,146 @@ class SYSTEM:
                     if statusNotification['value']['status'] in ["Available", "Finishing", "Unavailable", "Faulted", "SuspendedEV", "SuspendedEVSE"]:
                         self.available.append(evcs)
             else:
-                heartbeat = dojot.check_data(par["URL"], evcs['id'], "heartbeatReq", 30)
                 if heartbeat:
                     self.available.append(evcs)
                 else:
                     self.unavailable.append(evcs)
-                    if os.environ.get('SECURITY_MODE', "TRUE") != 'FALSE':
+                    # Ao voltar, o carregador recebe de novo o perfil, mesmo que igual ao último
+                    for connector in range(1, evcs['nconn'] + 1):
+                        setpoints.cache.forget((evcs['id'], 0 if evcs['nconn'] == 1 else connector))
+                    if SECURITY_MODE:
                         for connector in range(1, evcs['nconn'] + 1):
                              self.Ptotal = max(self.Ptotal - evcs[f'conn{connector}_Pmax'], 0)
                         if NOTIFICATION: print(f"EVCS {evcs['id']} is not sending data")
-            time.sleep(1)
 
-def optimize(setup):
+def queue_command(key, device, value, unit, function, *args):
+    """Queue a command for `key` and return a Future with the device response."""
+    # Setpoint igual ao último aceito não é reenviado
+    if setpoints.cache.is_current(key, value, unit):
+        return commands.resolved(setpoints.ACCEPTED)
+    future = commands.queue.submit(key, device, function, *args)
+
+    def record(future):
+        if future.result() is not commands.SUPERSEDED:
+            setpoints.cache.record(key, value, unit, future.result())
+
+    future.add_done_callback(record)
+    return future
+
+
+def send_profile(evcs_id, connector_id, unit, limit, protocol):
+    return queue_command((evcs_id, connector_id), evcs_id, limit, unit,
+                         dojot.set_charging_profile, evcs_id, connector_id, unit, limit, protocol)
+
+
+def send_bess(bess_id, power):
+    return queue_command((bess_id, None), bess_id, power, 'kW', opt.bess.send_command, bess_id, power)
+
+
+def optimize(setup, deadline=None, audit=None):
+    deadline = deadline or Deadline(None)
+    # Setups que esperaram na fila além do prazo não chegam a coletar telemetria
+    deadline.check('before start')
+    audit = audit or CycleAudit(setup['id'])
     system = SYSTEM(setup)
+    audit.system = system
     system.add_devices(setup)
+    audit.phase('devices')
+    deadline.check('after devices')
     system.total_power()
+    audit.phase('measurements')
+    deadline.check('after measurements')
     system.evcs_status()
+    audit.phase('status')
+    # Sem tempo para concluir o despacho: o chamador leva o setup ao estado seguro
+    deadline.check('before dispatch')
 
 
     if NOTIFICATION: print("Setting EVCS to its minimum power")
-    for evcs in system.available:
-        if evcs is not None:
-            for connector in range(1, evcs['nconn'] + 1):
-                if evcs[f"conn{connector}_Pmax"] < 10:
-                    Pmin = 1.5
-                elif evcs[f"conn{connector}_Pmax"] < 30:
-                    Pmin = 3
-                elif evcs[f"conn{connector}_Pmax"] < 50:
-                    Pmin = 5
-                else:
-                    Pmin = 10
-    
-                if NOTIFICATION: print(f'Setting EVCS {evcs["id"]} to {Pmin} kW')
-                if evcs['control'] == 'current':
-                    limit = int(Pmin * 1000 / evcs[f'conn{connector}_Vnom'])
-                    if evcs['nconn'] == 1:
-                        connector_id = 0
-                    else:
-                        connector_id = connector
-                    data = dojot.set_charging_profile(evcs['id'], connector_id, 'A', limit, evcs['protocol'])
-                    if NOTIFICATION: print(data)                    
-                    # verify if the limit is set correctly data should be {'status': 'Accepted'} but could be a empty dict
-                    if data != {'status': 'Accepted'}: 
-                        if NOTIFICATION: print(f'Error setting EVCS {evcs["id"]} to {limit} A')
-                        system.Ptotal = system.Ptotal - evcs[f'conn{connector}_Pmax']
-                    else:
-                        if NOTIFICATION: print(f'Success setting EVCS {evcs["id"]} to {limit} A')
-                        system.Ptotal = system.Ptotal - Pmin
-
-                
-                elif evcs['control'] == 'power':
-                    limit = Pmin
-                    if evcs['nconn'] == 1:
-                        connector_id = 0
-                    else:
-                        connector_id = connector
-                    data = dojot.set_charging_profile(evcs['id'], connector_id, 'W', limit * 1000, evcs['protocol'])
-                    print(data)
-                    if data != {'status': 'Accepted'}: 
-                        print(f'Error setting EVCS {evcs["id"]} to {limit} A')
-                        system.Ptotal = system.Ptotal - evcs[f'conn{connector}_Pmax']
-                    else:
-                        print(f'Success setting EVCS {evcs["id"]} to {limit} A')
-                        system.Ptotal = system.Ptotal - Pmin
+    available = dispatch.Connectors(system.available)
+    Pmin = dispatch.pmin_tiers(available.Pmax)
+    limits = dispatch.to_limits(Pmin, available)
+    # Todos os perfis vão para a fila de uma vez; as respostas são conferidas depois
+    pending = {}
+    for i in available.controlled():
+        evcs = available.evcs[i]
+        unit = dispatch.UNITS[available.control[i]]
+        limit = int(limits[i]) if unit == 'A' else float(limits[i])
+        if NOTIFICATION: print(f'Setting EVCS {evcs["id"]} to {Pmin[i]} kW')
+        pending[i] = (unit, limit, send_profile(evcs['id'], int(available.connector_id[i]), unit, limit, evcs['protocol']))
+    for i, (unit, limit, future) in pending.items():
+        evcs = available.evcs[i]
+        data = commands.outcome(future, deadline.remaining())
+        audit.setpoint(evcs['id'], int(available.connector_id[i]), limit, unit, data, 'pmin')
+        if NOTIFICATION: print(data)
+        # verify if the limit is set correctly data should be {'status': 'Accepted'} but could be a empty dict
+        if data != {'status': 'Accepted'}:
+            if NOTIFICATION: print(f'Error setting EVCS {evcs["id"]} to {limit} {unit}')
+            system.Ptotal = system.Ptotal - float(available.Pmax[i])
+        else:
+            if NOTIFICATION: print(f'Success setting EVCS {evcs["id"]} to {limit} {unit}')
+            system.Ptotal = system.Ptotal - float(Pmin[i])
 
     
+    audit.phase('pmin')
     if NOTIFICATION: print(f"Total power for EV dispatch: {system.Ptotal} kW")
     if NOTIFICATION: print("Starting seending power to devices")
-    Pmax_evcs = 0
-    for evcs in system.charging:
-        if evcs is not None:
-            for connector in range(1, evcs['nconn'] + 1):
-                Pmax_evcs += evcs[f'conn{connector}_Pmax']
-
-    control = {}
-    for evcs in system.charging:
-        if evcs is not None:
-            for connector in range(1, evcs['nconn'] + 1):
-                if evcs['nconn'] == 1:
-                    connector_id = 0
-                else:
-                    connector_id = evcs['connector_id']
-
-                pdisp = max(min((evcs[f'conn{connector}_Pmax'] * system.Ptotal)/Pmax_evcs, evcs[f'conn{connector}_Pmax']) ,0)
-                system.PEV += pdisp
-                if evcs['control'] == 'current':
-                    limit = int(pdisp * 1000 / evcs[f'conn{connector}_Vnom'])
-                    control.update({(evcs["id"], connector_id): [limit, "A"]})
-                elif evcs['control'] == 'power':    
-                    limit = pdisp
-                    control.update({(evcs["id"], connector_id): [limit, "W"]})
-                
+    charging = dispatch.Connectors(system.charging)
+    par = software.get_timeconfig(1)
+    if SOLVER == 'lp':
+        # Potência da rede que sobra depois das cargas fixas (Pmin, conectores indisponíveis)
+        grid = system.Ptotal - system.PPV - sum(bess['Pmax'] for bess in system.bess_to_discharge)
+        plan = lp.solver.solve(setup['id'], grid, system.PPV, float(charging.Pmax.sum()), system.bess,
+                               system.soc, float(INTERVAL) / 60, lp.grid_price(par, datetime.now()))
+        if NOTIFICATION: print(f"LP dispatch: {plan}")
+        Pev = plan['ev']
+    else:
+        Pev = system.Ptotal
+    # Todo o Pev em uma passada: cada conector recebe ao menos sua faixa de Pmin e o
+    # excedente que um conector não absorve é redistribuído aos demais
+    pdisp = dispatch.water_fill(Pev, dispatch.pmin_tiers(charging.Pmax), charging.Pmax)
+    system.PEV += float(pdisp.sum())
+    control = dispatch.to_control(charging, dispatch.to_limits(pdisp, charging))
+    audit.phase('allocation')
 
 
+    deadline.check('before BESS dispatch')
     if NOTIFICATION: print('Start BESS dispatch')
     # check bess state of charge
-    par = software.get_timeconfig(1)
     tmin_d = datetime.strptime(par["tmin_d"], "%H:%M")
     tmax_d = datetime.strptime(par["tmax_d"], "%H:%M")
     tmin_c = datetime.strptime(par["tmin_c"], "%H:%M")
     tmax_c = datetime.strptime(par["tmax_c"], "%H:%M")
     now = datetime.now()
-    if tmin_d <= now <= tmax_d:
+    if SOLVER == 'lp':
+        audit.branch = 'lp'
+        # 0.001 é o comando de repouso usado pelo restante do despacho
+        futures = {bess_id: send_bess(bess_id, pdisp if abs(pdisp) > 0.001 else 0.001)
+                   for bess_id, pdisp in plan['bess'].items()}
+        for bess_id, pdisp in plan['bess'].items():
+            response = commands.outcome(futures[bess_id], deadline.remaining())
+            audit.setpoint(bess_id, None, pdisp, 'kW', response, 'bess')
+            if response == {'status': 'Accepted'}:
+                if NOTIFICATION: print(f"Set BESS {bess_id} with {pdisp}kW")
+
+    elif tmin_d <= now <= tmax_d:
+        audit.branch = 'discharge_window'
         for bess in system.bess_to_discharge:
             
             pdisp = min(system.PEV, bess['Pmax'])
-            response = opt.bess.send_command(bess['id'], -pdisp)
+            response = commands.outcome(send_bess(bess['id'], -pdisp), deadline.remaining())
+            audit.setpoint(bess['id'], None, -pdisp, 'kW', response, 'bess')
             if response == {'status': 'Accepted'}:
                 if NOTIFICATION: print(f"discharging BESS {bess['id']} with {pdisp}kW")
                 system.PEV -= pdisp
                 
     elif system.PEV > system.Pnom + system.PPV:
+        audit.branch = 'peak_shaving'
         Pbess = system.PEV - system.Pnom - system.PPV
         for bess in system.bess_to_discharge:
             pdisp = min(Pbess, bess['Pmax'])
-            response = opt.bess.send_command(bess['id'], -pdisp)
+            response = commands.outcome(send_bess(bess['id'], -pdisp), deadline.remaining())
+            audit.setpoint(bess['id'], None, -pdisp, 'kW', response, 'bess')
             if response == {'status': 'Accepted'}:
                 if NOTIFICATION: print(f"discharging BESS {bess['id']} with {pdisp}kW")
                 Pbess -= pdisp
@@ -229,10 +291,12 @@ def optimize(setup):
     
 
     elif system.PPV > system.PEV:
+        audit.branch = 'pv_surplus'
         Pbess = system.PPV - system.PEV
         for bess in system.bess_to_charge + system.bess_to_discharge:
             pdisp = min(Pbess, bess['Pmax'])
-            response = opt.bess.send_command(bess['id'], pdisp)
+            response = commands.outcome(send_bess(bess['id'], pdisp), deadline.remaining())
+            audit.setpoint(bess['id'], None, pdisp, 'kW', response, 'bess')
             if response == {'status': 'Accepted'}:
                 if NOTIFICATION: print(f"charging BESS {bess['id']} with {pdisp}kW")
                 Pbess -= pdisp
@@ -240,11 +304,13 @@ def optimize(setup):
                 break
                 
     elif tmin_c <= now <= tmax_c:
+        audit.branch = 'charge_window'
         Pbess = system.Pnom + system.PPV - system.PEV
         for bess in system.bess_half_charged:
             if system.PEV <= system.Pnom + system.PPV - bess['Pmax']:
                 pdisp = min(Pbess - system.PEV, bess['Pmax'])
-                response = opt.bess.send_command(bess['id'], pdisp)
+                response = commands.outcome(send_bess(bess['id'], pdisp), deadline.remaining())
+                audit.setpoint(bess['id'], None, pdisp, 'kW', response, 'bess')
                 if response == {'status': 'Accepted'}:
                     if NOTIFICATION: print(f"charging BESS {bess['id']} with {pdisp}kW")
                     Pbess -= pdisp
@@ -252,9 +318,11 @@ def optimize(setup):
                     system.Ptotal -= pdisp
 
     else:
+        audit.branch = 'idle'
         for bess in system.bess:
             #set 0
-            response = opt.bess.send_command(bess['id'], 0.001)
+            response = commands.outcome(send_bess(bess['id'], 0.001), deadline.remaining())
+            audit.setpoint(bess['id'], None, 0.001, 'kW', response, 'bess')
             if response == {'status': 'Accepted'}:
                 if NOTIFICATION: print(f"Set BESS {bess['id']} with 0kW")
                 system.Ptotal -= bess['Pmax']
@@ -262,75 +330,146 @@ def optimize(setup):
 
 
 
-    for evcs_name, connector_id in control:
-        for evcs in system.charging:
-            if evcs['id'] == evcs_name:
-                limit = control[(evcs_name, connector_id)][0]
-                unit = control[(evcs_name, connector_id)][1]
-                if NOTIFICATION: print(f'Setting EVCS {evcs_name} to {limit} {unit}')
-                data = dojot.set_charging_profile(evcs_name, connector_id, unit, limit, evcs['protocol'])
-                if NOTIFICATION: print(data)
+    audit.phase('bess')
+    protocols = {evcs['id']: evcs['protocol'] for evcs in charging.evcs}
+    sent = {}
+    for (evcs_name, connector_id), (limit, unit) in control.items():
+        if NOTIFICATION: print(f'Setting EVCS {evcs_name} to {limit} {unit}')
+        sent[(evcs_name, connector_id)] = send_profile(evcs_name, connector_id, unit, limit, protocols[evcs_name])
+    # As respostas chegam pela fila; o setup espera por elas no máximo até o seu prazo
+    results = {key: commands.outcome(future, deadline.remaining()) for key, future in sent.items()}
+    for (evcs_name, connector_id), data in results.items():
+        audit.setpoint(evcs_name, connector_id, *control[(evcs_name, connector_id)], data, 'charging')
+    audit.phase('evcs')
+    accepted = sum(data == setpoints.ACCEPTED for data in results.values())
+    if NOTIFICATION: print(f"EVCS setpoints accepted: {accepted}/{len(results)}")
+    # Histórico do ciclo (gravado em lote fora do caminho do despacho)
+    history.record_dispatch(setup['id'], {'Ptotal': system.Ptotal, 'PEV': system.PEV, 'PPV': system.PPV,
+                                          'connectors': len(results), 'accepted': accepted})
 
 
 def set_zero(setup):
-    #zero all bess and evcs
-    for evcs in software.get_evcs_by_setup_id(setup['id']):
-            for connector in range(1, evcs['nconn'] + 1):
-                if evcs[f"conn{connector}_Pmax"] < 10:
-                    Pmin = 1.5
-                elif evcs[f"conn{connector}_Pmax"] < 30:
-                    Pmin = 3
-                elif evcs[f"conn{connector}_Pmax"] < 50:
-                    Pmin = 5
-                else:
-                    Pmin = 10
-    
-                if NOTIFICATION: print(f'Setting EVCS {evcs["id"]} to {Pmin} kW')
-                if evcs['control'] == 'current':
-                    limit = int(Pmin * 1000 / evcs[f'conn{connector}_Vnom'])
-                    if evcs['nconn'] == 1:
-                        connector_id = 0
-                    else:
-                        connector_id = connector
-                    data = dojot.set_charging_profile(evcs['id'], connector_id, 'A', limit, evcs['protocol'])
-                    if NOTIFICATION: print(data)                    
-                    if data != {'status': 'Accepted'}: 
-                        if NOTIFICATION: print(f'Error setting EVCS {evcs["id"]} to {limit} A')
-                    else:
-                        if NOTIFICATION: print(f'Success setting EVCS {evcs["id"]} to {limit} A')
-
-                
-                elif evcs['control'] == 'power':
-                    limit = Pmin
-                    if evcs['nconn'] == 1:
-                        connector_id = 0
-                    else:
-                        connector_id = connector
-                    data = dojot.set_charging_profile(evcs['id'], connector_id, 'W', limit * 1000, evcs['protocol'])
-                    if NOTIFICATION: print(data)
-                    if data != {'status': 'Accepted'}: 
-                        if NOTIFICATION: print(f'Error setting EVCS {evcs["id"]} to {limit} A')
-                    else:
-                        if NOTIFICATION: print(f'Success setting EVCS {evcs["id"]} to {limit} A')
-
-
-    for bess in software.get_bess_by_setup_id(setup['id']):
-        response = opt.bess.send_command(bess['id'], 0.001)
-        if NOTIFICATION: print(response)
-    return
-
-
-
-def cron_function():
-    setups = software.get_setups()
-    for setup in setups:
-        if setup is not None:
+    """
+    Take every EVCS connector of the setup to its Pmin and every BESS to rest.
+
+    All commands are sent concurrently by the safe-state executor under
+    OPT_SAFE_DEADLINE; returns its report with the outcome of each device.
+    """
+    devices = software.get_setup_devices(setup['id'])
+    if devices is None:
+        raise RuntimeError(f"Failed to load devices of setup {setup['id']}")
+    connectors = dispatch.Connectors(devices['evcs'])
+    Pmin = dispatch.pmin_tiers(connectors.Pmax)
+    orders, values = {}, {}
+    for (evcs_id, connector_id), (limit, unit) in dispatch.to_control(connectors, dispatch.to_limits(Pmin, connectors)).items():
+        # Protocolo visto no último ciclo; sem ele set_charging_profile assume OCPP 1.6
+        orders[(evcs_id, connector_id)] = (dojot.set_charging_profile,
+                                           (evcs_id, connector_id, unit, limit, PROTOCOLS.get(evcs_id)))
+        values[(evcs_id, connector_id)] = (limit, unit)
+    for bess in devices['bess']:
+        orders[(bess['id'], None)] = (opt.bess.send_command, (bess['id'], 0.001))
+        values[(bess['id'], None)] = (0.001, 'kW')
+    # Setpoints ainda na fila (ou em novas tentativas) não podem sobrescrever o estado seguro;
+    # os que já estão sendo enviados terminam antes do comando seguro do mesmo conector
+    in_flight = commands.queue.discard(orders)
+    report = safestate.executor.run(orders, after=in_flight)
+    for key, outcome in report['devices'].items():
+        setpoints.cache.record(key, *values[key], report['responses'].get(key))
+        if outcome != 'confirmed':
+            if NOTIFICATION: print(f"Safe state not confirmed by {key}: {outcome}")
+    if NOTIFICATION: print(f"Setup {setup['id']} safe state: {report['confirmed']} confirmed, "
+                           f"{report['rejected']} rejected, {report['timeout']} timeout in {report['elapsed']:.1f}s")
+    return report
+
+
+
+def run_setup(setup, deadline):
+    # Isolamento por setup: uma falha (ou prazo estourado) só leva este setup ao estado seguro
+    audit = CycleAudit(setup['id'])
+    try:
+        optimize(setup, deadline, audit)
+        audit.write('ok')
+        return 'ok'
+    except Exception as e:
+        if NOTIFICATION: print(f"Error in setup {setup['id']}: {e!r}")
+        # Decidido antes do estado seguro, que não pode reutilizar o nome `e`
+        status = 'deadline' if isinstance(e, DeadlineExceeded) else 'failed'
+        failure = e
+        if SECURITY_MODE:
             try:
-                optimize(setup)
-            except:
-                if NOTIFICATION: print(f"Error in setup {setup['id']}")
-                if SECURITY_MODE:
-                    set_zero(setup)
+                report = set_zero(setup)
+                for (device_id, connector_id), outcome in report['devices'].items():
+                    audit.setpoint(device_id, connector_id, None, None, outcome, 'safe_state')
+            except Exception as error:
+                if NOTIFICATION: print(f"Error setting setup {setup['id']} to zero: {error!r}")
+            audit.phase('safe_state')
+        audit.write(status, failure)
+        return status
+
+
+def _run_tracked(setup, deadline):
+    try:
+        return run_setup(setup, deadline)
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(setup['id'])
+
+
+def cron_function(stagger=0):
+    """
+    Run one optimization cycle over every setup.
+
+    With `stagger` > 0 the setups are started spread over that many seconds
+    to smooth the outbound load; every setup still has to finish within
+    SETUP_DEADLINE counted from the start of the cycle. Setups still running
+    from a previous cycle are skipped.
+    """
+    setups = software.get_setups()
+    if setups is None:
+        if NOTIFICATION: print("Failed to load setups")
+        return
+    setups = [setup for setup in setups if setup is not None]
+    with _in_flight_lock:
+        busy = [setup['id'] for setup in setups if setup['id'] in _in_flight]
+        setups = [setup for setup in setups if setup['id'] not in _in_flight]
+        _in_flight.update(setup['id'] for setup in setups)
+    if busy and NOTIFICATION: print(f"Setups still running from the previous cycle: {busy}")
+    if setups:
+        executor = ThreadPoolExecutor(max_workers=SETUP_WORKERS, thread_name_prefix='setup')
+        start = time.monotonic()
+        futures = {}
+        for index, setup in enumerate(setups):
+            offset = index * stagger / len(setups)
+            delay = start + offset - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            # O prazo conta a partir do início do ciclo, inclusive para setups escalonados ou na fila
+            budget = max(SETUP_DEADLINE - offset, 0) if SETUP_DEADLINE else None
+            futures[executor.submit(_run_tracked, setup, Deadline(budget))] = setup
+        # Não bloqueia o próximo ciclo além do prazo: setups atrasados encerram sozinhos no próximo check
+        timeout = max(start + SETUP_DEADLINE - time.monotonic(), 0) + 30 if SETUP_DEADLINE else None
+        done, pending = wait(futures, timeout=timeout)
+        executor.shutdown(wait=False)
+        summary = {}
+        for future in done:
+            status = future.result()
+            summary[status] = summary.get(status, 0) + 1
+        if pending:
+            summary['running'] = len(pending)
+        if busy:
+            summary['busy'] = len(busy)
+        if NOTIFICATION: print(f"Setups optimized: {summary}")
+    # Latência das chamadas à plataforma neste ciclo, por host
+    if NOTIFICATION: print(f"Platform calls: {client.stats()}")
+    client.reset_stats()
+    # Comandos economizados pelo cache de setpoints neste ciclo
+    if NOTIFICATION: print(f"Setpoints: {setpoints.cache.stats()}")
+    setpoints.cache.reset_stats()
+    if NOTIFICATION: print(f"Commands: {commands.queue.stats()}")
+    commands.queue.reset_stats()
+    if NOTIFICATION: print(f"Safe state: {safestate.executor.stats()}")
+    safestate.executor.reset_stats()
+    if NOTIFICATION: print(f"Telemetry store: {telemetry.store.stats()}")
     return
 
 
@@ -0,0 +1,61 @@
+from opt.commands import SUPERSEDED
+from opt.setpoints import ACCEPTED
+from data.batch import BatchWriter
+from datetime import datetime
+import json
+import time
+
+INSERT_AUDIT = """
+    INSERT INTO dispatch_audit (cycle_at, setup_id, status, branch, Ptotal, PEV, PPV, setpoints, timings, error)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Gravação em lote por uma thread própria: o ciclo só enfileira o registro
+writer = BatchWriter(INSERT_AUDIT, 'dispatch audit', interval=5)
+
+
+def response_status(response):
+    if response == ACCEPTED or response == SUPERSEDED:
+        return response['status']
+    if response is None:
+        return 'no response'
+    if isinstance(response, str):
+        return response[:200]
+    if isinstance(response, dict) and 'status' in response:
+        return str(response['status'])
+    return str(response)[:200]
+
+
+class CycleAudit:
+    """
+    Structured record of one optimization of one setup.
+
+    optimize() marks the end of each phase, the BESS branch taken and every
+    setpoint with the device response; write() queues the record for the
+    dispatch_audit table.
+    """
+
+    def __init__(self, setup_id):
+        self.setup_id = setup_id
+        self.cycle_at = datetime.utcnow()
+        self.branch = None
+        self.setpoints = []
+        self.timings = {}
+        self.system = None
+        self._last = time.monotonic()
+
+    def phase(self, name):
+        now = time.monotonic()
+        self.timings[name] = round(now - self._last, 4)
+        self._last = now
+
+    def setpoint(self, device_id, connector_id, value, unit, response, phase):
+        self.setpoints.append({'device_id': device_id, 'connector_id': connector_id, 'value': value,
+                               'unit': unit, 'phase': phase, 'status': response_status(response)})
+
+    def write(self, status, error=None):
+        system = self.system
+        row = (self.cycle_at, self.setup_id, status, self.branch,
+               getattr(system, 'Ptotal', None), getattr(system, 'PEV', None), getattr(system, 'PPV', None),
+               json.dumps(self.setpoints), json.dumps(self.timings), repr(error) if error is not None else None)
+        return writer.add([row])
@@ -1,45 +1,196 @@
-import requests
+from opt.client import client
+import threading
+import fcntl
+import json
+import time
 import os
-NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE")
+NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE") != 'FALSE'
 
+TOKEN_URL = "https://platmobele.cpqd.com.br/auth/realms/portal/protocol/openid-connect/token"
+CLIENT_ID = "gders-api"
+# Renova o token este número de segundos antes de expirar
+TOKEN_REFRESH_MARGIN = float(os.getenv("TOKEN_REFRESH_MARGIN", 30))
+# Arquivo compartilhado pelos processos do contêiner (vazio desativa o compartilhamento)
+TOKEN_CACHE_FILE = os.getenv("TOKEN_CACHE_FILE", "/tmp/secondlayer_platform_token.json")
 
-def get_access_token():
-    user = os.getenv("PLATMOBLE_USER", "adm")
-    password = os.getenv("PLATMOBLE_PASSWORD", "#Pl4tm0b@cpqd")
-
-    # URL do endpoint
-    url = "https://platmobele.cpqd.com.br/auth/realms/portal/protocol/openid-connect/token"
-    
-    # Dados necessários para a requisição
-    payload = {
-        "client_id": "gders-api",
-        "grant_type": "password",
-        "scope": "openid",
-        "username": user,
-        "password": password
-    }
-    
+
+def request_token(payload):
     # Cabeçalhos (se necessário)
     headers = {
         "Content-Type": "application/x-www-form-urlencoded"
     }
-    
+
     try:
         # Enviar a requisição POST
-        response = requests.post(url, data=payload, headers=headers)
-        
+        response = client.post(TOKEN_URL, data=payload, headers=headers)
+
         # Verificar se a requisição foi bem-sucedida
         if response.status_code == 200:
             # Parsear a resposta para JSON
-            data = response.json()
-            # Retornar o access_token
-            return data.get("access_token", "Access token não encontrado.")
+            return response.json(), None
         else:
             # Retornar mensagem de erro em caso de falha
-            return f"Erro: {response.status_code}, {response.text}"
-    
+            return None, f"Erro: {response.status_code}, {response.text}"
+
     except Exception as e:
-        return f"Erro ao fazer a requisição: {e}"
+        return None, f"Erro ao fazer a requisição: {e}"
+
+
+class TokenManager:
+    """
+    Caches the platform access token until shortly before it expires.
+
+    Expired tokens are renewed with the refresh token when it is still valid
+    and with a password grant otherwise. A lock makes concurrent threads share
+    a single renewal, and the token is kept in TOKEN_CACHE_FILE under an
+    exclusive file lock so every process in the container reuses it.
+    """
+
+    def __init__(self, cache_file=TOKEN_CACHE_FILE, margin=TOKEN_REFRESH_MARGIN):
+        self.cache_file = cache_file
+        self.margin = margin
+        self._token = None
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'shared': 0, 'refresh_grants': 0, 'password_grants': 0, 'errors': 0,
+                      'rejected': 0}
+
+    def _valid(self, token, key='expires_at'):
+        return token is not None and token.get(key, 0) - self.margin > time.time()
+
+    def _read_shared(self):
+        try:
+            with open(self.cache_file, 'rt') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_shared(self, token):
+        tmp = f"{self.cache_file}.{os.getpid()}"
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wt') as f:
+                json.dump(token, f)
+            os.replace(tmp, self.cache_file)
+        except OSError as e:
+            if NOTIFICATION: print(f"Erro ao salvar o token compartilhado: {e}")
+
+    def _grant(self):
+        now = time.time()
+        data = None
+        if self._valid(self._token, 'refresh_expires_at'):
+            data, error = request_token({
+                "client_id": CLIENT_ID,
+                "grant_type": "refresh_token",
+                "refresh_token": self._token['refresh_token'],
+            })
+            if data is not None:
+                self.stats['refresh_grants'] += 1
+        if data is None:
+            user = os.getenv("PLATMOBLE_USER", "adm")
+            password = os.getenv("PLATMOBLE_PASSWORD", "#Pl4tm0b@cpqd")
+            data, error = request_token({
+                "client_id": CLIENT_ID,
+                "grant_type": "password",
+                "scope": "openid",
+                "username": user,
+                "password": password
+            })
+            if data is None:
+                self.stats['errors'] += 1
+                return None, error
+            self.stats['password_grants'] += 1
+        if "access_token" not in data:
+            self.stats['errors'] += 1
+            return None, "Access token não encontrado."
+        token = {
+            'access_token': data['access_token'],
+            'expires_at': now + float(data.get('expires_in', 0)),
+            'refresh_token': data.get('refresh_token'),
+            'refresh_expires_at': now + float(data.get('refresh_expires_in', 0)) if data.get('refresh_token') else 0,
+        }
+        return token, None
+
+    def _renew(self):
+        if not self.cache_file:
+            return self._grant()
+        # Lock exclusivo entre processos: quem chega depois encontra o token já renovado
+        with open(f"{self.cache_file}.lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                shared = self._read_shared()
+                if self._valid(shared):
+                    self.stats['shared'] += 1
+                    return shared, None
+                if shared is not None and not self._valid(self._token, 'refresh_expires_at'):
+                    # aproveita o refresh token obtido por outro processo
+                    self._token = shared
+                token, error = self._grant()
+                if token is not None:
+                    self._write_shared(token)
+                return token, error
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def get_token(self):
+        token = self._token
+        if self._valid(token):
+            self.stats['hits'] += 1
+            return token['access_token']
+        with self._lock:
+            # Outra thread pode ter renovado enquanto esperávamos o lock
+            if self._valid(self._token):
+                self.stats['hits'] += 1
+                return self._token['access_token']
+            token, error = self._renew()
+            if token is None:
+                return error
+            self._token = token
+            return token['access_token']
+
+    def invalidate(self, access_token=None):
+        """
+        Drop a token the platform rejected, here and in TOKEN_CACHE_FILE, so
+        the next get_token() renews it. With `access_token`, only that token
+        is dropped: a newer one renewed meanwhile is kept.
+        """
+        with self._lock:
+            self.stats['rejected'] += 1
+            if self._token is not None and access_token in (None, self._token['access_token']):
+                self._token = None
+            if not self.cache_file:
+                return
+            with open(f"{self.cache_file}.lock", 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    shared = self._read_shared()
+                    if shared is not None and access_token in (None, shared.get('access_token')):
+                        os.remove(self.cache_file)
+                except OSError:
+                    pass
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+token_manager = TokenManager()
+
+
+def get_access_token():
+    # Token em cache até pouco antes de expirar; em caso de falha retorna a mensagem de erro
+    return token_manager.get_token()
+
+
+def post(url, json, **kwargs):
+    """
+    POST a platform request whose payload carries the token in 'authorization'.
+    On a 401 the token is invalidated and the request is retried once with a
+    fresh one.
+    """
+    response = client.post(url, json=json, **kwargs)
+    if response.status_code == 401 and 'authorization' in json:
+        if NOTIFICATION: print(f"Token rejeitado pela plataforma, renovando: {url}")
+        token_manager.invalidate(json['authorization'])
+        response = client.post(url, json=dict(json, authorization=get_access_token()), **kwargs)
+    return response
 
 
 if __name__ == "__main__":
@@ -47,4 +198,4 @@ if __name__ == "__main__":
     token = get_access_token()
     print(token)
 
-    a=1
\ No newline at end of file
+    a=1
@@ -1,9 +1,9 @@
-import requests
 from opt.auth import get_access_token
+from opt import auth
 import time
 import os
 
-NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE")
+NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE") != 'FALSE'
 
 
 def get_bess_measurements(identification="a22162"):
@@ -36,7 +36,7 @@ def get_bess_measurements(identification="a22162"):
     
     try:
         # Enviar a requisição POST
-        response = requests.post(url, json=payload, headers=headers)
+        response = auth.post(url, json=payload, headers=headers)
         
         # Verificar se a requisição foi bem-sucedida
         if response.status_code == 200:
@@ -69,7 +69,7 @@ def send_command(device_id, power):
     
     try:
         # Enviar a requisição POST
-        response = requests.post(url, json=payload, headers=headers)
+        response = auth.post(url, json=payload, headers=headers)
         
         # Verificar se a requisição foi bem-sucedida
         if response.status_code == 200:
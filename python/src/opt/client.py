@@ -0,0 +1,134 @@
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+import threading
+import requests
+import time
+import os
+
+# Timeouts padrão (s) das chamadas à plataforma; podem ser sobrescritos por chamada
+CONNECT_TIMEOUT = float(os.getenv('PLATFORM_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.getenv('PLATFORM_READ_TIMEOUT', 30))
+# Conexões keep-alive mantidas por host
+POOL_SIZE = int(os.getenv('PLATFORM_POOL_SIZE', 16))
+# Limite de requisições por segundo por host (0 desativa) e rajada permitida
+RATE_LIMIT = float(os.getenv('PLATFORM_RATE_LIMIT', 10))
+RATE_BURST = int(os.getenv('PLATFORM_RATE_BURST', 10))
+# Limites específicos por host, ex.: "platmobele.cpqd.com.br=5,cs3060.cpqd.com.br=2"
+RATE_LIMITS = os.getenv('PLATFORM_RATE_LIMITS', '')
+
+
+def parse_rate_limits(value):
+    limits = {}
+    for item in value.split(','):
+        if '=' in item:
+            host, rate = item.split('=', 1)
+            limits[host.strip()] = float(rate)
+    return limits
+
+
+class RateLimiter:
+    """Token bucket per host: at most `rate` requests per second after a burst of `burst`."""
+
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST, per_host=None):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.per_host = per_host if per_host is not None else parse_rate_limits(RATE_LIMITS)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host):
+        rate = self.per_host.get(host, self.rate)
+        if rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * rate)
+            # Reserva o token agora; se faltar, espera fora do lock o tempo até ele existir
+            tokens -= 1
+            self._buckets[host] = (tokens, now)
+            wait = -tokens / rate if tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class PlatformClient:
+    """
+    HTTP client shared by every platform call of the optimizer.
+
+    Keeps one keep-alive session per host, so a cycle reuses a handful of warm
+    TLS connections instead of opening one per request, applies default
+    connect/read timeouts, throttles each host with a RateLimiter and records
+    latency counters per host.
+    """
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, pool_size=POOL_SIZE,
+                 limiter=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.limiter = limiter or RateLimiter()
+        self._sessions = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def session(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if self._pid != os.getpid():
+                # Sockets herdados de outro processo não podem ser reaproveitados
+                self._sessions = {}
+                self._pid = os.getpid()
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[host] = session
+        return host, session
+
+    def _record(self, host, elapsed, error, throttled=0.0):
+        with self._lock:
+            stats = self._stats.setdefault(host, {'requests': 0, 'errors': 0, 'total_s': 0.0, 'max_s': 0.0,
+                                                  'throttled_s': 0.0})
+            stats['requests'] += 1
+            stats['total_s'] += elapsed
+            stats['max_s'] = max(stats['max_s'], elapsed)
+            stats['throttled_s'] += throttled
+            if error:
+                stats['errors'] += 1
+
+    def request(self, method, url, timeout=None, **kwargs):
+        host, session = self.session(url)
+        throttled = self.limiter.acquire(host)
+        start = time.perf_counter()
+        error = True
+        try:
+            response = session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            error = response.status_code >= 400
+            return response
+        finally:
+            self._record(host, time.perf_counter() - start, error, throttled)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for host, stats in self._stats.items():
+                result[host] = dict(stats)
+                result[host]['avg_s'] = stats['total_s'] / stats['requests'] if stats['requests'] else 0.0
+            return result
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {}
+
+
+client = PlatformClient()
@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import os
+
+# Número máximo de leituras de telemetria em paralelo por processo
+COLLECT_WORKERS = int(os.getenv('OPT_COLLECT_WORKERS', 16))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=COLLECT_WORKERS, thread_name_prefix='collect')
+    return _executor
+
+
+def gather(function, items, executor=None):
+    """
+    Call function(item) for every item concurrently, bounded by COLLECT_WORKERS.
+
+    Returns a list of (item, result, error) in the order of `items`; an
+    exception raised for one device is returned as its error instead of
+    aborting the others. The per-host pacing is done by the platform client.
+    `executor` replaces the shared pool (e.g. for background work that must
+    not delay the cycle).
+    """
+    items = list(items)
+    if not items:
+        return []
+    executor = executor or get_executor()
+    futures = [executor.submit(function, item) for item in items]
+    results = []
+    for item, future in zip(items, futures):
+        try:
+            results.append((item, future.result(), None))
+        except Exception as e:
+            results.append((item, None, e))
+    return results
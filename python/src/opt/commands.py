@@ -0,0 +1,199 @@
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from opt.setpoints import ACCEPTED
+from collections import deque
+import itertools
+import threading
+import random
+import time
+import os
+
+NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE") != 'FALSE'
+# Comandos enviados em paralelo (dispositivos distintos) por processo
+COMMAND_WORKERS = int(os.getenv('OPT_COMMAND_WORKERS', 16))
+# Política única de novas tentativas: até ATTEMPTS envios, espera aleatória em [0, min(MAX, BASE * 2^n)]
+COMMAND_ATTEMPTS = int(os.getenv('OPT_COMMAND_ATTEMPTS', 3))
+COMMAND_BACKOFF = float(os.getenv('OPT_COMMAND_BACKOFF', 0.5))
+COMMAND_BACKOFF_MAX = float(os.getenv('OPT_COMMAND_BACKOFF_MAX', 8))
+
+# Resultado de um comando substituído por outro mais novo do mesmo conector antes de ser enviado
+SUPERSEDED = {'status': 'Superseded'}
+
+
+class Backoff:
+    """Exponential backoff with full jitter, retrying until the device accepts."""
+
+    def __init__(self, attempts=COMMAND_ATTEMPTS, base=COMMAND_BACKOFF, cap=COMMAND_BACKOFF_MAX):
+        # attempts=None: sem limite de envios, só `stop` encerra
+        self.attempts = None if attempts is None else max(attempts, 1)
+        self.base = base
+        self.cap = cap
+
+    def delay(self, retry):
+        return random.uniform(0, min(self.cap, self.base * 2 ** retry))
+
+    def run(self, function, *args, stop=None):
+        """
+        Call function(*args) until it returns ACCEPTED or the attempts run out
+        (never, with attempts=None).
+
+        `stop` is checked before each retry; when it returns True the last
+        response is returned without retrying. Returns (response, attempts).
+        """
+        response = None
+        sent = 0
+        for attempt in (itertools.count() if self.attempts is None else range(self.attempts)):
+            if attempt:
+                if stop is not None and stop():
+                    break
+                time.sleep(self.delay(attempt - 1))
+            try:
+                response = function(*args)
+            except Exception as e:
+                if NOTIFICATION: print(f"Command failed: {e!r}")
+                response = None
+            sent += 1
+            if response == ACCEPTED:
+                break
+        return response, sent
+
+
+def retry(function, *args):
+    """Send one command synchronously with the default backoff policy."""
+    return Backoff().run(function, *args)[0]
+
+
+def resolved(response):
+    """Future already holding `response`, for commands that did not need to be sent."""
+    future = Future()
+    future.set_result(response)
+    return future
+
+
+def outcome(future, timeout=None):
+    """Response of a queued command, or None if it did not finish within `timeout` seconds."""
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        return None
+
+
+class _Command:
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.future = Future()
+        # Marcado por discard() enquanto o comando está sendo enviado: não tenta de novo
+        self.cancelled = False
+
+
+class CommandQueue:
+    """
+    Outbound command queue shared by the optimizer.
+
+    Only the latest command per key (device, connector) is kept: a command
+    submitted while an older one for the same key is still waiting replaces
+    it, and the older future resolves to SUPERSEDED. Commands of one device
+    are sent one at a time in submission order, different devices in
+    parallel on up to `workers` threads, each with the Backoff policy.
+    submit() returns a Future with the device response.
+    """
+
+    def __init__(self, workers=COMMAND_WORKERS, backoff=None):
+        self.workers = workers
+        self.backoff = backoff or Backoff()
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._sending = {}
+        self._devices = {}
+        self._stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats():
+        return {'submitted': 0, 'coalesced': 0, 'sent': 0, 'retries': 0, 'accepted': 0, 'failed': 0, 'discarded': 0}
+
+    def _get_executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='command')
+            self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, key, device, function, *args):
+        command = _Command(function, args)
+        with self._lock:
+            self._stats['submitted'] += 1
+            previous = self._pending.get(key)
+            self._pending[key] = command
+            if previous is not None:
+                # Mantém a posição na fila do dispositivo, só o conteúdo é trocado
+                self._stats['coalesced'] += 1
+            elif device in self._devices:
+                self._devices[device].append(key)
+            else:
+                self._devices[device] = deque([key])
+                self._get_executor().submit(self._drain, device)
+        if previous is not None:
+            previous.future.set_result(SUPERSEDED)
+        return command.future
+
+    def _drain(self, device):
+        while True:
+            with self._lock:
+                keys = self._devices[device]
+                if not keys:
+                    del self._devices[device]
+                    return
+                key = keys.popleft()
+                command = self._pending.pop(key, None)
+                if command is not None:
+                    self._sending[key] = command
+            if command is not None:
+                try:
+                    self._send(key, command)
+                finally:
+                    with self._lock:
+                        if self._sending.get(key) is command:
+                            del self._sending[key]
+
+    def discard(self, keys):
+        """
+        Drop the commands still waiting for `keys` (their futures resolve to
+        SUPERSEDED) and cancel the retries of those being sent. Returns
+        {key: future} of the commands in flight, so the caller can wait for
+        their last attempt before sending anything that must come after it.
+        """
+        with self._lock:
+            dropped = [self._pending.pop(key) for key in keys if key in self._pending]
+            sending = {key: self._sending[key] for key in keys if key in self._sending}
+            for command in sending.values():
+                command.cancelled = True
+            self._stats['discarded'] += len(dropped) + len(sending)
+        for command in dropped:
+            command.future.set_result(SUPERSEDED)
+        return {key: command.future for key, command in sending.items()}
+
+    def _superseded(self, key, command):
+        with self._lock:
+            return command.cancelled or key in self._pending
+
+    def _send(self, key, command):
+        # Não insiste em um valor velho se já chegou outro para o mesmo conector (ou foi cancelado)
+        response, attempts = self.backoff.run(command.function, *command.args,
+                                              stop=lambda: self._superseded(key, command))
+        with self._lock:
+            self._stats['sent'] += attempts
+            self._stats['retries'] += attempts - 1
+            self._stats['accepted' if response == ACCEPTED else 'failed'] += 1
+        command.future.set_result(response)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, waiting=len(self._pending))
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = self._empty_stats()
+
+
+queue = CommandQueue()
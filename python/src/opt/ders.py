@@ -1,8 +1,8 @@
 from opt.auth import get_access_token
-import requests
+from opt import auth
 import os
 
-NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE")
+NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE") != 'FALSE'
 
 
 def send_command_to_manager(access_token, p_manual):
@@ -27,7 +27,7 @@ def send_command_to_manager(access_token, p_manual):
     
     try:
         # Enviar a requisição POST
-        response = requests.post(url, json=payload, headers=headers)
+        response = auth.post(url, json=payload, headers=headers)
         
         # Verificar se a requisição foi bem-sucedida
         if response.status_code == 200:
@@ -0,0 +1,132 @@
+import numpy as np
+
+# Modos de controle codificados nos arrays
+CONTROL_NONE = 0
+CONTROL_CURRENT = 1
+CONTROL_POWER = 2
+CONTROL_CODES = {'none': CONTROL_NONE, 'current': CONTROL_CURRENT, 'power': CONTROL_POWER}
+UNITS = {CONTROL_CURRENT: 'A', CONTROL_POWER: 'W'}
+
+# Faixas de potência mínima por conector: Pmax < 10 kW -> 1.5 kW, < 30 -> 3, < 50 -> 5, demais -> 10
+PMIN_LIMITS = (10, 30, 50)
+PMIN_VALUES = (1.5, 3, 5)
+PMIN_DEFAULT = 10
+
+
+class Connectors:
+    """
+    EVCS connectors packed into flat arrays, one position per connector.
+
+    `evcs` and `connector` keep the link back to the station dict and the
+    connector number (1..nconn); `connector_id` is the id sent to the
+    platform (0 for single-connector stations).
+    """
+
+    def __init__(self, evcs_list):
+        self.evcs = []
+        connector, connector_id, Pmax, Vnom, control = [], [], [], [], []
+        for evcs in evcs_list:
+            if evcs is None:
+                continue
+            code = CONTROL_CODES.get(evcs['control'], CONTROL_NONE)
+            for number in range(1, evcs['nconn'] + 1):
+                self.evcs.append(evcs)
+                connector.append(number)
+                connector_id.append(0 if evcs['nconn'] == 1 else number)
+                Pmax.append(evcs[f'conn{number}_Pmax'])
+                Vnom.append(evcs[f'conn{number}_Vnom'])
+                control.append(code)
+        self.connector = np.array(connector, dtype=int)
+        self.connector_id = np.array(connector_id, dtype=int)
+        self.Pmax = np.array(Pmax, dtype=float)
+        self.Vnom = np.array(Vnom, dtype=float)
+        self.control = np.array(control, dtype=int)
+        if np.isnan(self.Pmax).any():
+            raise ValueError("Every connector up to nconn must have a Pmax")
+        current = self.control == CONTROL_CURRENT
+        if (np.isnan(self.Vnom[current]) | (self.Vnom[current] <= 0)).any():
+            raise ValueError("Current controlled connectors must have a positive Vnom")
+
+    def __len__(self):
+        return len(self.evcs)
+
+    def controlled(self):
+        """Indexes of the connectors that accept a charging profile."""
+        return np.flatnonzero(self.control != CONTROL_NONE)
+
+
+def pmin_tiers(Pmax):
+    Pmax = np.asarray(Pmax, dtype=float)
+    return np.select([Pmax < limit for limit in PMIN_LIMITS], PMIN_VALUES, PMIN_DEFAULT)
+
+
+def water_fill(budget, floors, ceilings, weights=None):
+    """
+    Split `budget` among connectors by water-filling, in O(n log n).
+
+    Each connector gets x_i = clip(w_i * level, floor_i, ceiling_i), with the
+    common level chosen so that the allocations add up to the budget: power
+    a connector cannot absorb flows to the others instead of being lost.
+    Weights default to the ceilings, which keeps the shares proportional to
+    Pmax. If the budget cannot cover the floors they are scaled down
+    proportionally; if it exceeds the ceilings every connector with a
+    positive weight gets its ceiling.
+    """
+    # O teto é o limite físico do conector: um piso acima dele é reduzido ao teto
+    ceilings = np.asarray(ceilings, dtype=float)
+    floors = np.minimum(np.asarray(floors, dtype=float), ceilings)
+    weights = ceilings.copy() if weights is None else np.asarray(weights, dtype=float)
+    if len(floors) == 0 or budget <= 0:
+        return np.zeros_like(floors)
+    floor_total = floors.sum()
+    if budget <= floor_total:
+        return floors * (budget / floor_total)
+    # Conectores com peso nulo ficam no piso; os demais sobem linearmente entre
+    # o nível em que saem do piso (floor/w) e o nível em que atingem o teto (ceiling/w)
+    active = weights > 0
+    reachable = np.where(active, ceilings, floors)
+    if budget >= reachable.sum():
+        return reachable
+    w = weights[active]
+    starts = floors[active] / w
+    stops = ceilings[active] / w
+    levels = np.concatenate([starts, stops])
+    # Em cada ponto de quebra: o termo constante perde o piso e a inclinação ganha w ao sair
+    # do piso; ao chegar ao teto o constante ganha o teto e a inclinação perde w
+    d_const = np.concatenate([-floors[active], ceilings[active]])
+    d_slope = np.concatenate([w, -w])
+    order = np.argsort(levels, kind='stable')
+    levels = levels[order]
+    const = floor_total + np.cumsum(d_const[order])
+    slope = np.cumsum(d_slope[order])
+    totals = const + slope * levels
+    k = np.searchsorted(totals, budget)
+    # O nível procurado está no segmento anterior ao ponto k (a soma é contínua e crescente)
+    level = (budget - const[k - 1]) / slope[k - 1] if slope[k - 1] > 0 else levels[k]
+    return np.clip(weights * level, floors, ceilings)
+
+
+def to_limits(power, connectors):
+    """
+    Convert power in kW into the limit sent to each connector.
+
+    Current controlled connectors get amperes (truncated like int()), power
+    controlled connectors get watts; connectors without control get 0.
+    """
+    power = np.asarray(power, dtype=float)
+    limits = np.zeros_like(power)
+    current = connectors.control == CONTROL_CURRENT
+    limits[current] = np.trunc(power[current] * 1000 / connectors.Vnom[current])
+    watts = connectors.control == CONTROL_POWER
+    limits[watts] = power[watts] * 1000
+    return limits
+
+
+def to_control(connectors, limits):
+    """Setpoints in the {(evcs_id, connector_id): [limit, unit]} format used by the dispatch."""
+    control = {}
+    for i in connectors.controlled():
+        code = connectors.control[i]
+        limit = int(limits[i]) if code == CONTROL_CURRENT else float(limits[i])
+        control[(connectors.evcs[i]['id'], int(connectors.connector_id[i]))] = [limit, UNITS[code]]
+    return control
@@ -4,7 +4,7 @@ import requests
 import pytz
 import os
 
-NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE")
+NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE") != 'FALSE'
 MODE = os.getenv("PYTHON_ENV", "develop")
 
 
@@ -45,7 +45,11 @@ def check_data(url, device_id, attr, interval_minutes):
     headers = {"Content-Type": "application/json"}
     
     # Fazendo a requisição HTTP POST
-    response = requests.post(url, json=payload, headers=headers)
+    try:
+        response = auth.post(url, json=payload, headers=headers)
+    except requests.RequestException:
+        # Timeout ou falha de conexão: trata como ausência de dados
+        return protocol, False
     
     # Verificando se a requisição foi bem-sucedida
     if response.status_code >= 200 and response.status_code < 300:
@@ -71,8 +75,11 @@ def check_data(url, device_id, attr, interval_minutes):
             "attr": "heartbeatReq",
             "lastN": 1
         }
-        heartbeat = requests.post(url, json=payload, headers=headers)
-        if heartbeat.status_code >= 200 and heartbeat.status_code < 300:
+        try:
+            heartbeat = auth.post(url, json=payload, headers=headers)
+        except requests.RequestException:
+            heartbeat = None
+        if heartbeat is not None and heartbeat.status_code >= 200 and heartbeat.status_code < 300:
             heartbeat_data = heartbeat.json()
         else:
             heartbeat_data = False
@@ -85,8 +92,11 @@ def check_data(url, device_id, attr, interval_minutes):
             "lastN": 1,
             "authorization": token
         }
-        heartbeat = requests.post(url, json=payload, headers=headers)
-        if heartbeat.status_code >= 200 and heartbeat.status_code < 300:
+        try:
+            heartbeat = auth.post(url, json=payload, headers=headers)
+        except requests.RequestException:
+            heartbeat = None
+        if heartbeat is not None and heartbeat.status_code >= 200 and heartbeat.status_code < 300:
             heartbeat_data = heartbeat.json()
         else:
             heartbeat_data = False
@@ -186,46 +196,15 @@ def set_charging_profile(device_id, connector_id, charging_rate_unit, limit, pro
 
     
     headers = {"Content-Type": "application/json"}
-    response = requests.post(url, json=payload, headers=headers)
-    if response.status_code >= 200 and response.status_code < 300:
-        data = response.json()
-        if data != {'status': 'Accepted'}:
-            #try again
-            response = requests.post(url, json=payload, headers=headers)
-            if response.status_code >= 200 and response.status_code < 300:
-                data = response.json()
-                return data
-            else:
-                return None
-        return data
-    else:
-        #try again
-        response = requests.post(url, json=payload, headers=headers)
+    # Uma única tentativa: novas tentativas seguem a política de backoff de opt.commands
+    try:
+        response = auth.post(url, json=payload, headers=headers)
         if response.status_code >= 200 and response.status_code < 300:
-            data = response.json()
-            if data != {'status': 'Accepted'}:
-                #try again
-                response = requests.post(url, json=payload, headers=headers)
-                if response.status_code >= 200 and response.status_code < 300:
-                    data = response.json()
-                else:
-                    return None
-            return data
-        else:
-            #try again
-            response = requests.post(url, json=payload, headers=headers)
-            if response.status_code >= 200 and response.status_code < 300:
-                data = response.json()
-                if data != {'status': 'Accepted'}:
-                    #try again
-                    response = requests.post(url, json=payload, headers=headers)
-                    if response.status_code >= 200 and response.status_code < 300:
-                        data = response.json()
-                    else:
-                        return None
-                return data
-            else:
-                return None
+            return response.json()
+        return None
+    except requests.RequestException:
+        # Timeout ou falha de conexão
+        return None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+from datetime import datetime
+import numpy as np
+import threading
+import os
+
+# Preços relativos por kW no intervalo; só a ordem entre eles define o despacho
+EV_VALUE = float(os.getenv('LP_EV_VALUE', 100))
+GRID_PRICE = float(os.getenv('LP_GRID_PRICE', 5))
+GRID_PRICE_PEAK = float(os.getenv('LP_GRID_PRICE_PEAK', 10))        # janela de descarga (tmin_d..tmax_d)
+GRID_PRICE_OFFPEAK = float(os.getenv('LP_GRID_PRICE_OFFPEAK', 1))   # janela de carga (tmin_c..tmax_c)
+# Valor da energia armazenada e custo de desgaste: carregar vale STORAGE_VALUE - CYCLE_COST,
+# descarregar custa STORAGE_VALUE + CYCLE_COST, então o BESS só carrega da rede na janela de
+# carga e só descarrega no pico ou quando a rede não cobre os EVs
+STORAGE_VALUE = float(os.getenv('LP_STORAGE_VALUE', 5))
+CYCLE_COST = float(os.getenv('LP_CYCLE_COST', 1))
+
+
+def in_window(now, start, end):
+    """True if the time of day of `now` is inside [start, end] ("HH:MM"), which may wrap midnight."""
+    now = now.time()
+    start = datetime.strptime(start, "%H:%M").time()
+    end = datetime.strptime(end, "%H:%M").time()
+    if start <= end:
+        return start <= now <= end
+    return now >= start or now <= end
+
+
+def grid_price(par, now):
+    if in_window(now, par["tmin_d"], par["tmax_d"]):
+        return GRID_PRICE_PEAK
+    if in_window(now, par["tmin_c"], par["tmax_c"]):
+        return GRID_PRICE_OFFPEAK
+    return GRID_PRICE
+
+
+def merit_order(cost, previous=None):
+    """Indexes of `cost` in increasing order, reusing `previous` when it is still sorted."""
+    if previous is not None and len(previous) == len(cost) and (np.diff(cost[previous]) >= 0).all():
+        return previous, True
+    return np.argsort(cost, kind='stable'), False
+
+
+def balance(source_cost, source_cap, sink_value, sink_cap, warm=(None, None)):
+    """
+    Solve the single-bus dispatch LP
+
+        max  sum(sink_value * y) - sum(source_cost * x)
+        s.t. sum(x) == sum(y),  0 <= x <= source_cap,  0 <= y <= sink_cap
+
+    With one balance row and box bounds the optimum is the merit order: the
+    most valuable sinks are served by the cheapest sources while the value
+    exceeds the cost. `warm` holds the orderings of a previous solve, which
+    skip the sort when prices did not change order. Returns (x, y, orders,
+    warm_hits).
+    """
+    source_order, source_hit = merit_order(source_cost, warm[0])
+    sink_order, sink_hit = merit_order(-sink_value, warm[1])
+    supply = np.zeros_like(source_cap)
+    demand = np.zeros_like(sink_cap)
+    source_left = source_cap[source_order].copy()
+    sink_left = sink_cap[sink_order].copy()
+    i = j = 0
+    while i < len(source_order) and j < len(sink_order) \
+            and sink_value[sink_order[j]] > source_cost[source_order[i]]:
+        q = min(source_left[i], sink_left[j])
+        supply[source_order[i]] += q
+        demand[sink_order[j]] += q
+        source_left[i] -= q
+        sink_left[j] -= q
+        if source_left[i] <= 0:
+            i += 1
+        if sink_left[j] <= 0:
+            j += 1
+    return supply, demand, (source_order, sink_order), source_hit + sink_hit
+
+
+class DispatchLP:
+    """
+    Optimal dispatch of grid, PV, BESS and EVCS for one setup and one interval.
+
+    Sources are the grid (up to the setup headroom), PV and BESS discharge;
+    sinks are the EV connectors (as one aggregate, split afterwards by
+    dispatch.water_fill) and BESS charge. BESS bounds come from the state of
+    charge, so a battery never plans more energy than it holds or can take.
+    The merit orders of each setup are kept between cycles as warm starts.
+    """
+
+    def __init__(self):
+        self._warm = {}
+        self._lock = threading.Lock()
+        self.stats = {'solves': 0, 'warm_starts': 0}
+
+    def solve(self, setup_id, grid_cap, pv, ev_cap, bess, soc, hours, price):
+        """
+        `bess` is the list of BESS dicts and `soc` maps the id of the ones with a
+        fresh reading to their state of charge (0..1). Returns a dict with the
+        EV total, grid and PV use and the BESS setpoints in kW (positive charges,
+        negative discharges, like opt.bess.send_command).
+        """
+        bess = [b for b in bess if b['id'] in soc]
+        energy = np.array([b['Emax'] for b in bess], dtype=float)
+        Pmax = np.array([b['Pmax'] for b in bess], dtype=float)
+        level = np.array([soc[b['id']] for b in bess], dtype=float)
+        discharge_cap = np.clip(np.minimum(Pmax, level * energy / hours), 0, None)
+        charge_cap = np.clip(np.minimum(Pmax, (1 - level) * energy / hours), 0, None)
+
+        labels = tuple(b['id'] for b in bess)
+        source_cost = np.concatenate([[price, 0.0], np.full(len(bess), STORAGE_VALUE + CYCLE_COST)])
+        source_cap = np.concatenate([[max(grid_cap, 0.0), max(pv, 0.0)], discharge_cap])
+        sink_value = np.concatenate([[EV_VALUE], np.full(len(bess), STORAGE_VALUE - CYCLE_COST)])
+        sink_cap = np.concatenate([[max(ev_cap, 0.0)], charge_cap])
+
+        with self._lock:
+            previous = self._warm.get(setup_id)
+        warm = previous[1] if previous is not None and previous[0] == labels else (None, None)
+        supply, demand, orders, hits = balance(source_cost, source_cap, sink_value, sink_cap, warm)
+        with self._lock:
+            self._warm[setup_id] = (labels, orders)
+            self.stats['solves'] += 1
+            self.stats['warm_starts'] += hits == 2
+
+        power = demand[1:] - supply[2:]
+        return {
+            'ev': float(demand[0]),
+            'grid': float(supply[0]),
+            'pv': float(supply[1]),
+            'bess': {b['id']: float(p) for b, p in zip(bess, power)},
+            'objective': float(sink_value @ demand - source_cost @ supply),
+        }
+
+
+solver = DispatchLP()
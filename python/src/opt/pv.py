@@ -1,8 +1,8 @@
-import requests
 from opt.auth import get_access_token
+from opt import auth
 import os
 
-NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE")
+NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE") != 'FALSE'
 
 
 def get_pv_measurements(resource_identification="4bf29d"):
@@ -35,7 +35,7 @@ def get_pv_measurements(resource_identification="4bf29d"):
     
     try:
         # Enviar a requisição POST
-        response = requests.post(url, json=payload, headers=headers)
+        response = auth.post(url, json=payload, headers=headers)
         
         # Verificar se a requisição foi bem-sucedida
         if response.status_code == 200:
@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor, wait, TimeoutError as FutureTimeout
+from opt.commands import Backoff
+from opt.setpoints import ACCEPTED
+import threading
+import time
+import os
+
+# Prazo total (s) para levar um setup ao estado seguro e envios simultâneos por processo
+SAFE_DEADLINE = float(os.getenv('OPT_SAFE_DEADLINE', 30))
+SAFE_WORKERS = int(os.getenv('OPT_SAFE_WORKERS', 32))
+
+
+class SafeStateExecutor:
+    """
+    Sends the fail-safe commands of a setup all at once under a hard deadline.
+
+    Runs on its own thread pool, so it is never queued behind regular
+    commands. Each command keeps retrying with the backoff delays (no
+    attempt limit) until the device confirms or the deadline arrives; run()
+    returns when every device answered or the deadline expired, whichever
+    comes first, with the outcome of each device.
+    """
+
+    def __init__(self, workers=SAFE_WORKERS, deadline=SAFE_DEADLINE, backoff=None):
+        self.workers = workers
+        self.deadline = deadline
+        self.backoff = backoff or Backoff(attempts=None)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {'runs': 0, 'confirmed': 0, 'rejected': 0, 'timeout': 0, 'max_s': 0.0}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='safe-state')
+                self._pid = os.getpid()
+            return self._executor
+
+    def _send(self, function, args, expires_at, after):
+        if after is not None:
+            # Espera a última tentativa de um setpoint em andamento para não ser sobrescrito por ela
+            try:
+                after.result(timeout=max(expires_at - time.monotonic(), 0))
+            except FutureTimeout:
+                return None, 0
+        return self.backoff.run(function, *args, stop=lambda: time.monotonic() >= expires_at)
+
+    def run(self, commands, deadline=None, after=None):
+        """
+        `commands` maps a key (device, connector) to (function, args); `after`
+        optionally maps a key to a future to wait for before its first send
+        (see CommandQueue.discard). Returns
+        {'devices': {key: 'confirmed' | 'rejected' | 'timeout'}, 'responses':
+        {key: response}, 'elapsed': seconds} plus the count of each outcome.
+        """
+        deadline = self.deadline if deadline is None else deadline
+        start = time.monotonic()
+        expires_at = start + deadline
+        executor = self._get_executor()
+        futures = {}
+        after = after or {}
+        for key, (function, args) in commands.items():
+            futures[executor.submit(self._send, function, args, expires_at, after.get(key))] = key
+        done, _ = wait(futures, timeout=deadline)
+        report = {'devices': {}, 'responses': {}, 'confirmed': 0, 'rejected': 0, 'timeout': 0}
+        for future, key in futures.items():
+            if future in done:
+                response = future.result()[0]
+                outcome = 'confirmed' if response == ACCEPTED else 'rejected'
+                report['responses'][key] = response
+            else:
+                outcome = 'timeout'
+            report['devices'][key] = outcome
+            report[outcome] += 1
+        report['elapsed'] = time.monotonic() - start
+        with self._lock:
+            self._stats['runs'] += 1
+            for outcome in ('confirmed', 'rejected', 'timeout'):
+                self._stats[outcome] += report[outcome]
+            self._stats['max_s'] = max(self._stats['max_s'], report['elapsed'])
+        return report
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {'runs': 0, 'confirmed': 0, 'rejected': 0, 'timeout': 0, 'max_s': 0.0}
+
+
+executor = SafeStateExecutor()
@@ -0,0 +1,152 @@
+from data.pool import connection_params
+from datetime import datetime
+import mysql.connector
+import threading
+import time
+import opt
+import os
+
+INTERVAL = float(os.environ.get('INTERVAL', 5))  # minutes
+NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE") != 'FALSE'
+# Tick ainda em execução quando chega o próximo: 'skip' descarta, 'coalesce' roda uma vez ao terminar
+OVERLAP_POLICY = os.environ.get('OPT_OVERLAP_POLICY', "skip").lower()
+# Fração do intervalo usada para escalonar o início dos setups (0 desativa)
+STAGGER = float(os.environ.get('OPT_STAGGER', 0.2))
+# Eleição de líder pelo lock consultivo do MySQL ('FALSE' roda sempre, ex.: desenvolvimento local)
+LEADER_ELECTION = os.environ.get('OPT_LEADER_ELECTION', "TRUE") != 'FALSE'
+LEADER_LOCK = 'secondlayer_optimizer_leader'
+
+
+class LeaderLock:
+    """
+    Leadership held through a MySQL advisory lock on a dedicated connection.
+
+    The lock belongs to the session, so if the process dies or loses the
+    connection another instance acquires it on its next tick.
+    """
+
+    def __init__(self, name=LEADER_LOCK):
+        self.name = name
+        self._conn = None
+
+    def _query(self, query, values=()):
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(query, values)
+            return cursor.fetchone()[0]
+        finally:
+            cursor.close()
+
+    def acquire(self):
+        """Return True while this process is the leader, trying to become it otherwise."""
+        try:
+            if self._conn is not None and self._conn.is_connected():
+                if self._query("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (self.name,)) == 1:
+                    return True
+            else:
+                self.release()
+                self._conn = mysql.connector.connect(**connection_params())
+                self._conn.autocommit = True
+            return self._query("SELECT GET_LOCK(%s, 0)", (self.name,)) == 1
+        except Exception as e:
+            if NOTIFICATION: print(f"Leader election failed: {e}")
+            self.release()
+            return False
+
+    def release(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()  # encerrar a sessão libera o lock
+            except Exception:
+                pass
+
+
+class Scheduler:
+    """
+    Runs opt.cron_function on fixed wall-clock ticks.
+
+    Ticks are aligned to multiples of the interval (e.g. :00, :05, :10), so
+    the schedule does not drift with the cycle duration. Only the leader
+    runs cycles, a tick that arrives while a cycle is still running is
+    skipped or coalesced according to OVERLAP_POLICY, and the setups of a
+    cycle are started spread over STAGGER of the interval.
+    """
+
+    def __init__(self, interval=INTERVAL * 60, policy=OVERLAP_POLICY, stagger=STAGGER,
+                 leader=None, cycle=None):
+        self.interval = interval
+        self.policy = policy
+        self.stagger = stagger * interval
+        self.leader = leader if leader is not None else (LeaderLock() if LEADER_ELECTION else None)
+        self.cycle = cycle or opt.cron_function
+        self._running = None
+        self._pending = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stats = {'ticks': 0, 'cycles': 0, 'skipped': 0, 'coalesced': 0, 'not_leader': 0}
+
+    def next_tick(self, now=None):
+        now = time.time() if now is None else now
+        return (now // self.interval + 1) * self.interval
+
+    def _run_cycle(self, tick):
+        try:
+            if NOTIFICATION: print('Running optimization', datetime.fromtimestamp(tick))
+            self.cycle(stagger=self.stagger)
+        except Exception as e:
+            if NOTIFICATION: print(f"Optimization cycle failed: {e!r}")
+        finally:
+            with self._lock:
+                self._running = None
+                pending, self._pending = self._pending, False
+            if pending and not self._stop.is_set():
+                # Ticks perdidos durante o ciclo viram uma única execução imediata
+                self.tick(time.time())
+
+    def _lead(self):
+        # Chamado com self._lock: a conexão do lock não é usada por duas threads ao mesmo tempo
+        return self.leader is None or self.leader.acquire()
+
+    def is_leader(self):
+        """True while this instance holds (or can take) the scheduler leadership."""
+        with self._lock:
+            return self._lead()
+
+    def tick(self, tick):
+        with self._lock:
+            self.stats['ticks'] += 1
+            if self._running is not None:
+                if self.policy == 'coalesce':
+                    self._pending = True
+                    self.stats['coalesced'] += 1
+                else:
+                    self.stats['skipped'] += 1
+                if NOTIFICATION: print(f"Previous cycle still running, tick {self.policy}")
+                return False
+            if not self._lead():
+                self.stats['not_leader'] += 1
+                return False
+            self.stats['cycles'] += 1
+            self._running = threading.Thread(target=self._run_cycle, args=(tick,), name='optimizer-cycle', daemon=True)
+            self._running.start()
+            return True
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            tick = self.next_tick()
+            # wait() em vez de sleep() para permitir parada imediata
+            if self._stop.wait(max(tick - time.time(), 0)):
+                break
+            self.tick(tick)
+
+    def start(self):
+        thread = threading.Thread(target=self.run_forever, name='optimizer-scheduler', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+        if self.leader is not None:
+            with self._lock:
+                self.leader.release()
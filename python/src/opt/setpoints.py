@@ -0,0 +1,75 @@
+import threading
+import time
+import os
+
+# Variação relativa abaixo da qual um setpoint é considerado igual ao último aceito
+SETPOINT_TOLERANCE = float(os.getenv('OPT_SETPOINT_TOLERANCE', 0.02))
+# Reenvio forçado após este tempo (s), caso o dispositivo tenha perdido o perfil (0 desativa o cache)
+SETPOINT_TTL = float(os.getenv('OPT_SETPOINT_TTL', 900))
+
+ACCEPTED = {'status': 'Accepted'}
+
+
+class SetpointCache:
+    """
+    Last setpoint accepted by each (device, connector).
+
+    A command whose value is within the tolerance band of the last accepted
+    one, with the same unit and sent less than `ttl` seconds ago, is
+    suppressed and reported as accepted. Rejected or failed commands drop
+    the entry, so the next cycle sends again.
+    """
+
+    def __init__(self, tolerance=SETPOINT_TOLERANCE, ttl=SETPOINT_TTL):
+        self.tolerance = tolerance
+        self.ttl = ttl
+        self._last = {}
+        self._lock = threading.Lock()
+        self._stats = {'sent': 0, 'suppressed': 0, 'refreshed': 0}
+
+    def _same(self, last, value, unit):
+        last_value, last_unit = last
+        return unit == last_unit and abs(value - last_value) <= self.tolerance * max(abs(last_value), 1)
+
+    def is_current(self, key, value, unit):
+        """True if sending (value, unit) to `key` would not change anything."""
+        with self._lock:
+            entry = self._last.get(key)
+            if entry is None:
+                return False
+            last, sent_at = entry
+            if time.monotonic() - sent_at >= self.ttl:
+                self._stats['refreshed'] += 1
+                return False
+            if self._same(last, value, unit):
+                self._stats['suppressed'] += 1
+                return True
+            return False
+
+    def accept(self, key, value, unit):
+        with self._lock:
+            self._last[key] = ((value, unit), time.monotonic())
+
+    def forget(self, key):
+        with self._lock:
+            self._last.pop(key, None)
+
+    def record(self, key, value, unit, response):
+        """Update `key` with the response of a command sent to it."""
+        with self._lock:
+            self._stats['sent'] += 1
+        if response == ACCEPTED:
+            self.accept(key, value, unit)
+        else:
+            self.forget(key)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._last))
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {'sent': 0, 'suppressed': 0, 'refreshed': 0}
+
+
+cache = SetpointCache()
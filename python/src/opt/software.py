@@ -1,46 +1,83 @@
+from data import migrations, repository
+from opt.client import client
+from functools import lru_cache
 import os
-import requests
 
-NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE")
+NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE") != 'FALSE'
+# 'direct': lê o cadastro do MySQL no próprio processo; 'http': usa a API via nginx
+DATA_BACKEND = os.environ.get('OPT_DATA_BACKEND', "direct").lower()
 
+# Endpoint da API -> tabela correspondente no acesso direto
+ENDPOINT_TABLES = {'evcs/': 'EVCS', 'bess/': 'BESS', 'pv/': 'PV', 'v2g/': 'V2G'}
 
+
+@lru_cache(maxsize=None)
 def is_running_in_docker():
+    # /proc/1/cgroup não muda durante a vida do processo: lido uma única vez
     try:
         with open('/proc/1/cgroup', 'rt') as f:
             content = f.read()
         return 'docker' in content
     except Exception:
         return False
-    
-def get_setups():
+
+
+def get_base_url():
     if is_running_in_docker():
-        base_url = 'http://nginx:80/ders/secondlayer/'
-    else:
-        base_url = 'http://localhost:40080/ders/secondlayer/'
-    
-    url = base_url + 'setups/'
+        return 'http://nginx:80/ders/secondlayer/'
+    return 'http://localhost:40080/ders/secondlayer/'
 
-    headers = {'accept': 'application/json'}
-    response = requests.get(url, headers=headers)
-    if response.status_code >= 200 and response.status_code < 300:
-        setups = response.json()
-    else:
+
+def schema_ready():
+    # O acesso direto depende do esquema migrado; se o banco não estiver pronto, falha como o HTTP
+    return migrations.ensure_schema()
+
+
+def _direct(function, *args):
+    try:
+        return function(*args)
+    except Exception as e:
+        if NOTIFICATION: print(f"Erro ao consultar o banco de dados: {e}")
         return None
-    return setups
+
+
+def get_pages(url, headers, params=None):
+    """GET a paginated list, following the X-Next-Cursor header; None if any page fails."""
+    params = dict(params or {})
+    items = []
+    while True:
+        response = client.get(url, headers=headers, params=params)
+        if not (response.status_code >= 200 and response.status_code < 300):
+            return None
+        items += response.json()
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return items
+        params['cursor'] = cursor
+
+def get_setups():
+    if DATA_BACKEND == 'direct':
+        if not schema_ready():
+            return None
+        return _direct(repository.get_setups)
+
+    url = get_base_url() + 'setups/'
+
+    headers = {'accept': 'application/json'}
+    return get_pages(url, headers)
 
 def get_data_by_setup_id(endpoint, setup_id):
-    if is_running_in_docker():
-        base_url = 'http://nginx:80/ders/secondlayer/'
-    else:
-        base_url = 'http://localhost:40080/ders/secondlayer/'
+    if DATA_BACKEND == 'direct':
+        if not schema_ready():
+            return None
+        return _direct(repository.get_devices, ENDPOINT_TABLES[endpoint], setup_id)
 
-    url = base_url + endpoint
+    url = get_base_url() + endpoint
     headers = {'accept': 'application/json'}
 
-    response = requests.get(url, headers=headers)
-    if response.status_code >= 200 and response.status_code < 300:
-        data_list = response.json()
-    else:
+    # Filtro aplicado no servidor (índice em setup_id): só os dispositivos do setup trafegam
+    data_list = get_pages(url, headers, {'setup_id': setup_id})
+    if data_list is None:
         return None
 
     filtered_data = [data for data in data_list if data['setup_id'] == setup_id]
@@ -59,16 +96,41 @@ def get_pv_by_setup_id(setup_id):
 def get_v2g_by_setup_id(setup_id):
     return get_data_by_setup_id('v2g/', setup_id)
 
+def get_setup_devices(setup_id):
+    """
+    All devices of a setup as {'evcs': [...], 'bess': [...], 'pv': [...], 'v2g': [...]}.
+
+    The direct backend loads them with a single query; the HTTP backend makes
+    one filtered request per device type.
+    """
+    if DATA_BACKEND == 'direct':
+        if not schema_ready():
+            return None
+        setup = _direct(repository.get_setup_with_devices, setup_id)
+        if setup is None:
+            return None
+        return {key: setup[key] for key in ('evcs', 'bess', 'pv', 'v2g')}
+
+    devices = {
+        'evcs': get_evcs_by_setup_id(setup_id),
+        'bess': get_bess_by_setup_id(setup_id),
+        'pv': get_pv_by_setup_id(setup_id),
+        'v2g': get_v2g_by_setup_id(setup_id),
+    }
+    # Uma lista incompleta faria o ciclo despachar (ou o estado seguro comandar) sem parte dos dispositivos
+    if any(value is None for value in devices.values()):
+        return None
+    return devices
+
 def get_timeconfig(config_id):
-    # Verifica se está rodando dentro de um contêiner Docker
-    if is_running_in_docker():
-        base_url = 'http://nginx:80/ders/secondlayer/timeconfig/'
-    else:
-        base_url = 'http://localhost:40080/ders/secondlayer/timeconfig/'
-    
-    url = base_url + str(config_id)
+    if DATA_BACKEND == 'direct':
+        if not schema_ready():
+            return None
+        return _direct(repository.get_timeconfig, config_id)
+
+    url = get_base_url() + 'timeconfig/' + str(config_id)
     headers = {'accept': 'application/json'}
-    response = requests.get(url, headers=headers)
+    response = client.get(url, headers=headers)
     if response.status_code == 200:
         data = response.json()
         return data
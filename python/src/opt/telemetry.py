@@ -0,0 +1,145 @@
+from data.latest import LatestStore
+from data import telemetry as measurements
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from opt import software
+from opt import dojot
+from opt import collect
+import opt.bess
+import opt.pv
+import threading
+import time
+import os
+
+NOTIFICATION = os.environ.get('NOTIFICATION', "TRUE") != 'FALSE'
+# Período (s) da coleta em segundo plano (0 desativa: o ciclo consulta a plataforma diretamente)
+TELEMETRY_INTERVAL = float(os.getenv('OPT_TELEMETRY_INTERVAL', 60))
+# Leituras recebidas há mais tempo que isso (s) não são usadas pelo ciclo
+TELEMETRY_MAX_AGE = float(os.getenv('OPT_TELEMETRY_MAX_AGE', 2 * TELEMETRY_INTERVAL))
+# Leituras em paralelo da coleta em segundo plano (pool próprio, separado do usado pelo ciclo)
+TELEMETRY_WORKERS = int(os.getenv('OPT_TELEMETRY_WORKERS', 8))
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+store = LatestStore()
+
+
+def poll_measurement(device, attr, function):
+    """Read a BESS/PV measurement from the platform, storing it when valid; returns the raw response."""
+    response = function(device['id'])
+    if isinstance(response, dict) and 'date' in response and attr in response:
+        ts = datetime.strptime(response['date'], DATE_FORMAT)
+        store.put(device['id'], attr, float(response[attr]), ts)
+        # Também vai para o histórico de medições (timestamps em UTC)
+        utc = ts.astimezone(timezone.utc).replace(tzinfo=None)
+        measurements.writer.add([(device['id'], attr, utc, float(response[attr]), None)])
+    return response
+
+
+def measurement(device, attr, function):
+    """Latest `attr` of a BESS/PV in the platform response format, from the store when fresh."""
+    entry = store.get(device['id'], attr, TELEMETRY_MAX_AGE)
+    if entry is not None:
+        return {'date': entry.ts.strftime(DATE_FORMAT), attr: entry.value}
+    return poll_measurement(device, attr, function)
+
+
+def bess_measurements(bess):
+    return measurement(bess, 'battery_level', opt.bess.get_bess_measurements)
+
+
+def pv_measurements(pv):
+    return measurement(pv, 'total_DC_power', opt.pv.get_pv_measurements)
+
+
+def poll_evcs(url, evcs):
+    protocol, statusNotification = dojot.check_data(url, evcs['id'], "statusNotificationReq", 240)
+    store.put(evcs['id'], 'statusNotificationReq', (protocol, statusNotification))
+    heartbeat = None
+    if not statusNotification:
+        heartbeat = dojot.check_data(url, evcs['id'], "heartbeatReq", 30)
+        store.put(evcs['id'], 'heartbeatReq', heartbeat)
+    return protocol, statusNotification, heartbeat
+
+
+def evcs_status(url, evcs):
+    """(protocol, statusNotification, heartbeat) of an EVCS, from the store when fresh."""
+    status = store.get(evcs['id'], 'statusNotificationReq', TELEMETRY_MAX_AGE)
+    if status is not None:
+        protocol, statusNotification = status.value
+        if statusNotification:
+            return protocol, statusNotification, None
+        heartbeat = store.get(evcs['id'], 'heartbeatReq', TELEMETRY_MAX_AGE)
+        if heartbeat is not None:
+            return protocol, statusNotification, heartbeat.value
+    return poll_evcs(url, evcs)
+
+
+class TelemetryPoller:
+    """
+    Polls the telemetry of every device on its own cadence into `store`.
+
+    The optimization cycle then reads BESS SoC, PV power and EVCS status
+    locally, and only goes to the platform for devices whose last reading
+    is older than TELEMETRY_MAX_AGE. Polls run on their own thread pool and
+    only while `active()` is True (the scheduler leadership), so standby
+    instances do not load the platform.
+    """
+
+    def __init__(self, interval=TELEMETRY_INTERVAL, active=None, workers=TELEMETRY_WORKERS):
+        self.interval = interval
+        self.active = active
+        self.workers = workers
+        self._executor = None
+        self._stop = threading.Event()
+        self.stats = {'polls': 0, 'standby': 0, 'devices': 0, 'errors': 0, 'last_s': 0.0}
+
+    def _poll(self, item):
+        kind, device, url = item
+        if kind == 'bess':
+            return poll_measurement(device, 'battery_level', opt.bess.get_bess_measurements)
+        if kind == 'pv':
+            return poll_measurement(device, 'total_DC_power', opt.pv.get_pv_measurements)
+        return poll_evcs(url, device)
+
+    def poll_once(self):
+        start = time.monotonic()
+        setups = software.get_setups()
+        if setups is None:
+            if NOTIFICATION: print("Telemetry poller failed to load setups")
+            return
+        url = software.get_timeconfig(1)["URL"]
+        items = []
+        for setup in setups:
+            devices = software.get_setup_devices(setup['id'])
+            if devices is None:
+                continue
+            items += [('bess', bess, url) for bess in devices['bess']]
+            items += [('pv', pv, url) for pv in devices['pv']]
+            items += [('evcs', evcs, url) for evcs in devices['evcs']]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='telemetry')
+        results = collect.gather(self._poll, items, self._executor)
+        self.stats['polls'] += 1
+        self.stats['devices'] = len(items)
+        self.stats['errors'] += sum(error is not None for _, _, error in results)
+        self.stats['last_s'] = time.monotonic() - start
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                if self.active is None or self.active():
+                    self.poll_once()
+                else:
+                    self.stats['standby'] += 1
+            except Exception as e:
+                if NOTIFICATION: print(f"Telemetry poll failed: {e!r}")
+            self._stop.wait(max(self.interval - (time.monotonic() - started), 0))
+
+    def start(self):
+        thread = threading.Thread(target=self.run_forever, name='telemetry-poller', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,57 @@
+import numpy as np
+from opt.dispatch import water_fill
+
+
+def brute_force(budget, floors, ceilings, weights=None):
+    """Reference: bisection on the water level with the same floor/ceiling rules."""
+    ceilings = np.asarray(ceilings, dtype=float)
+    floors = np.minimum(np.asarray(floors, dtype=float), ceilings)
+    weights = ceilings if weights is None else np.asarray(weights, dtype=float)
+    if len(floors) == 0 or budget <= 0:
+        return np.zeros_like(floors)
+    if budget <= floors.sum():
+        return floors * budget / floors.sum()
+    reachable = np.where(weights > 0, ceilings, floors)
+    if budget >= reachable.sum():
+        return reachable
+    low, high = 0.0, 1e9
+    for _ in range(200):
+        level = (low + high) / 2
+        if np.clip(weights * level, floors, ceilings).sum() < budget:
+            low = level
+        else:
+            high = level
+    return np.clip(weights * high, floors, ceilings)
+
+
+def random_case(rng):
+    n = rng.integers(1, 40)
+    ceilings = rng.uniform(1, 100, n)
+    floors = ceilings * rng.uniform(0, 0.6, n) * rng.integers(0, 2, n)
+    weights = rng.uniform(0, 5, n) * rng.integers(0, 2, n) if rng.random() < 0.3 else None
+    budget = rng.uniform(-5, 1.2 * ceilings.sum())
+    return budget, floors, ceilings, weights
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    worst = 0.0
+    for _ in range(10000):
+        budget, floors, ceilings, weights = random_case(rng)
+        allocation = water_fill(budget, floors, ceilings, weights)
+        reference = brute_force(budget, floors, ceilings, weights)
+        worst = max(worst, np.abs(allocation - reference).max())
+        # Nunca ultrapassa o orçamento nem os tetos
+        assert allocation.sum() <= max(budget, 0) + 1e-6
+        assert (allocation <= ceilings + 1e-9).all()
+    print(f"Max difference to brute force: {worst}")
+    assert worst < 1e-6
+
+    # Pesos padrão: partilha proporcional ao Pmax
+    allocation = water_fill(30, [0, 0, 0], [5, 50, 50])
+    print(allocation)
+    assert np.isclose(allocation.sum(), 30) and np.isclose(allocation[0], 5 * 30 / 105)
+    # Excedente de um conector saturado vai para os demais
+    allocation = water_fill(90, [0, 0, 0], [5, 50, 50], weights=[1, 1, 1])
+    print(allocation)
+    assert np.allclose(allocation, [5, 42.5, 42.5])